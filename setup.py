@@ -74,6 +74,7 @@ setup(
        square = blockdiag.noderenderer.square
        roundedbox = blockdiag.noderenderer.roundedbox
        diamond = blockdiag.noderenderer.diamond
+       flowchart.condition = blockdiag.noderenderer.diamond
        minidiamond = blockdiag.noderenderer.minidiamond
        mail = blockdiag.noderenderer.mail
        note = blockdiag.noderenderer.note
@@ -100,5 +101,6 @@ setup(
        imagedraw_png = blockdiag.imagedraw.png
        imagedraw_svg = blockdiag.imagedraw.svg
        imagedraw_pdf = blockdiag.imagedraw.pdf
+       imagedraw_dzi = blockdiag.imagedraw.dzi
     """,
 )
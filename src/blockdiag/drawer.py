@@ -15,6 +15,7 @@
 
 from collections import defaultdict
 from blockdiag import imagedraw, noderenderer
+from blockdiag.imagedraw.displaylist import DisplayList
 from blockdiag.metrics import AutoScaler, DiagramMetrics
 from blockdiag.utils import Box
 
@@ -22,6 +23,7 @@ from blockdiag.utils import Box
 class DiagramDraw(object):
     shadow_colors = defaultdict(lambda: (0, 0, 0))
     shadow_colors['PNG'] = (64, 64, 64)
+    shadow_colors['DZI'] = (64, 64, 64)
     shadow_colors['PDF'] = (144, 144, 144)
 
     def __init__(self, _format, diagram, filename=None, **kwargs):
@@ -32,19 +34,31 @@ class DiagramDraw(object):
         self.filename = filename
         self.shadow = self.shadow_colors[self.format.upper()]
 
-        if self.format == 'PNG' and kwargs.get('antialias'):
-            self.scale_ratio = 2
+        if self.format == 'PNG' and kwargs.get('tiled'):
+            # tiled rasterization never holds whole of the page to reduce
+            kwargs['antialias_mode'] = 'primitive'
+
+        # antialias_mode: 'supersample' draws whole of the diagram at
+        # `supersampling` times size and reduces it on save; 'primitive'
+        # lets the drawer supersample each shape (keeps 1x canvas)
+        if (self.format == 'PNG' and kwargs.get('antialias') and
+                kwargs.get('antialias_mode', 'supersample') == 'supersample'):
+            self.scale_ratio = kwargs.get('supersampling') or 2
         else:
             self.scale_ratio = 1
 
-        self.drawer = imagedraw.create(self.format, self.filename,
-                                       filters=['linejump'],
-                                       scale_ratio=self.scale_ratio,
-                                       **kwargs)
+        if self.format == 'DISPLAYLIST':
+            # jumps of lines are resolved on replay (by drawer for output)
+            self.drawer = DisplayList(self.filename)
+        else:
+            self.drawer = imagedraw.create(self.format, self.filename,
+                                           filters=['linejump'],
+                                           scale_ratio=self.scale_ratio,
+                                           **kwargs)
 
         self.metrics = self.create_metrics(kwargs.get('basediagram', diagram),
                                            drawer=self.drawer, **kwargs)
-        if self.scale_ratio == 2:
+        if self.scale_ratio > 1:
             self.metrics = AutoScaler(self.metrics,
                                       scale_ratio=self.scale_ratio)
 
@@ -72,6 +86,15 @@ class DiagramDraw(object):
         for edge in (e for e in edges if e.style != 'none'):
             yield edge
 
+    def format_variants(self, drawer):
+        """Yields pairs of drawer and format for format dependent elements"""
+        if self.format == 'DISPLAYLIST':
+            variants = drawer.variants()
+            for _format in DisplayList.VARIANTS:
+                yield variants[_format], _format
+        else:
+            yield drawer, self.format
+
     def pagesize(self, scaled=False):
         if scaled:
             metrics = self.metrics
@@ -99,12 +122,11 @@ class DiagramDraw(object):
         for group in self.groups:
             if group.shape == 'box':
                 box = self.metrics.group(group).marginbox
-                if group.href and self.format == 'SVG':
-                    drawer = self.drawer.anchor(group.href)
-                else:
-                    drawer = self.drawer
+                for drawer, _format in self.format_variants(self.drawer):
+                    if group.href and _format == 'SVG':
+                        drawer = drawer.anchor(group.href)
 
-                drawer.rectangle(box, fill=group.color, filter='blur')
+                    drawer.rectangle(box, fill=group.color, filter='blur')
 
         # Drop node shadows.
         for node in self.nodes:
@@ -112,14 +134,17 @@ class DiagramDraw(object):
                 r = noderenderer.get(node.shape)
 
                 shape = r(node, self.metrics)
-                if node.href and self.format == 'SVG':
-                    drawer = self.drawer.anchor(node.href)
-                else:
-                    drawer = self.drawer
+                for drawer, _format in self.format_variants(self.drawer):
+                    if node.href and _format == 'SVG':
+                        drawer = drawer.anchor(node.href)
 
-                shape.render(drawer, self.format,
-                             fill=self.shadow, shadow=True,
-                             style=self.diagram.shadow_style)
+                    if _format == self.format:
+                        shadow = self.shadow
+                    else:
+                        shadow = self.shadow_colors[_format]
+
+                    shape.render(drawer, _format, fill=shadow, shadow=True,
+                                 style=self.diagram.shadow_style)
 
     def _draw_elements(self, **kwargs):
         for node in self.nodes:
@@ -143,13 +168,12 @@ class DiagramDraw(object):
     def node(self, node, **kwargs):
         r = noderenderer.get(node.shape)
         shape = r(node, self.metrics)
-        if node.href and self.format == 'SVG':
-            drawer = self.drawer.anchor(node.href)
-        else:
-            drawer = self.drawer
+        for drawer, _format in self.format_variants(self.drawer):
+            if node.href and _format == 'SVG':
+                drawer = drawer.anchor(node.href)
 
-        shape.render(drawer, self.format, fill=self.fill,
-                     badgeFill=self.badgeFill)
+            shape.render(drawer, _format, fill=self.fill,
+                         badgeFill=self.badgeFill)
 
     def group_label(self, group):
         m = self.metrics.group(group)
@@ -13,13 +13,13 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import pkg_resources
+from blockdiag.utils.entrypoints import iter_entry_points
 
 drawers = {}
 
 
-def init_imagedrawers():
-    for drawer in pkg_resources.iter_entry_points('blockdiag_imagedrawers'):
+def init_imagedrawers(name=None):
+    for drawer in iter_entry_points('blockdiag_imagedrawers', name):
         try:
             module = drawer.load()
             if hasattr(module, 'setup'):
@@ -33,10 +33,13 @@ def install_imagedrawer(ext, drawer):
 
 
 def create(_format, filename, **kwargs):
-    if len(drawers) == 0:
-        init_imagedrawers()
-
     _format = _format.lower()
+    if _format not in drawers:
+        # load the drawer of the format only (others are not imported)
+        init_imagedrawers('imagedraw_' + _format)
+        if _format not in drawers:
+            init_imagedrawers()
+
     if _format in drawers:
         drawer = drawers[_format](filename, **kwargs)
     else:
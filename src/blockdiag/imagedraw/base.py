@@ -15,6 +15,7 @@
 
 from functools import partial
 from blockdiag.imagedraw import textfolder
+from blockdiag.imagedraw.utils import cached
 from blockdiag.utils import Box
 
 
@@ -23,8 +24,7 @@ class ImageDraw(object):
     nosideeffect_methods = ['set_canvas_size', 'textsize', 'textlinesize']
     supported_path = False
     baseline_text_rendering = False
-
-    _method_cache = {}
+    folding_params = ['orientation', 'padding', 'line_spacing']
 
     def set_canvas_size(self, size):
         pass
@@ -63,6 +63,48 @@ class ImageDraw(object):
     def textlinesize(self, string, font, **kwargs):
         pass
 
+    def fit_fontsize(self, box, string, font, **kwargs):
+        """Find font size to render string into box.
+           Returns 0 if string could not be rendered in any size.
+        """
+        params = dict((name, kwargs[name]) for name in self.folding_params
+                      if name in kwargs)
+        return self._fit_fontsize(box.size, string, font, **params)
+
+    @cached
+    def _fit_fontsize(self, size, string, font, **kwargs):
+        # candidates: shrink font 0.8 times on each step
+        sizes = []
+        fontsize = font.size
+        while fontsize > 0:
+            sizes.append(fontsize)
+            fontsize = int(fontsize * 0.8)
+
+        box = Box(0, 0, size[0], size[1])
+
+        def fits(fontsize):
+            _font = font.duplicate()
+            _font.size = fontsize
+            lines = self.textfolder(box, string, _font, **kwargs)
+            return any(True for _ in lines.lines)
+
+        if not sizes or fits(sizes[0]):
+            return font.size
+
+        # binary search; smaller font fits more easily
+        lower, upper = 1, len(sizes)
+        while lower < upper:
+            i = (lower + upper) // 2
+            if fits(sizes[i]):
+                upper = i
+            else:
+                lower = i + 1
+
+        if lower < len(sizes):
+            return sizes[lower]
+        else:
+            return 0
+
     def text(self, xy, string, font, **kwargs):
         pass
 
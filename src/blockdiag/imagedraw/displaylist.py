@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from blockdiag import imagedraw
+from blockdiag.imagedraw import base
+from blockdiag.imagedraw.utils import textsize
+from blockdiag.utils import Size
+
+
+class DisplayList(base.ImageDraw):
+    """Backend-neutral drawer which records drawing operations.
+
+    Operations are recorded with resolved geometry, and replayed into any
+    image drawer later.  Texts are recorded as textareas; they are folded
+    and measured by the drawer replayed into.  Elements which depend on
+    the output format (shapes, shadows and links) are recorded as variants
+    for each format, and one of them is chosen on replay.
+    """
+    VARIANTS = ('SVG', 'PDF', 'PNG')
+    DEFAULT_VARIANT = 'PNG'  # for raster and other formats
+
+    def __init__(self, filename=None, **kwargs):
+        self.filename = filename
+        self.pagesize = Size(0, 0)
+        self.operations = []
+
+    def set_canvas_size(self, size):
+        self.pagesize = Size(*size)
+        self.operations = []
+
+    def textlinesize(self, string, font, **kwargs):
+        return textsize(string, font)
+
+    def record(self, name, *args, **kwargs):
+        self.operations.append((name, args, kwargs))
+
+    def set_options(self, **kwargs):
+        self.record('set_options', **kwargs)
+
+    def line(self, xy, **kwargs):
+        self.record('line', xy, **kwargs)
+
+    def rectangle(self, box, **kwargs):
+        self.record('rectangle', box, **kwargs)
+
+    def polygon(self, xy, **kwargs):
+        self.record('polygon', xy, **kwargs)
+
+    def arc(self, box, start, end, **kwargs):
+        self.record('arc', box, start, end, **kwargs)
+
+    def ellipse(self, box, **kwargs):
+        self.record('ellipse', box, **kwargs)
+
+    def path(self, pd, **kwargs):
+        self.record('path', pd, **kwargs)
+
+    def text(self, xy, string, font, **kwargs):
+        self.record('text', xy, string, font, **kwargs)
+
+    def textarea(self, box, string, font, **kwargs):
+        self.record('textarea', box, string, font, **kwargs)
+
+    def image(self, box, url):
+        self.record('image', box, url)
+
+    def anchor(self, url):
+        child = DisplayList()
+        self.record('anchor', url, child)
+        return child
+
+    def variants(self, formats=VARIANTS):
+        children = dict((_format, DisplayList()) for _format in formats)
+        self.record('variants', children)
+        return children
+
+    def replay(self, drawer, _format):
+        _format = _format.upper()
+        for name, args, kwargs in self.operations:
+            if name == 'anchor':
+                url, child = args
+                target = getattr(drawer, 'target', drawer)  # unwrap filters
+                if 'anchor' in target.self_generative_methods:
+                    child.replay(drawer.anchor(url), _format)
+                else:
+                    child.replay(drawer, _format)
+            elif name == 'variants':
+                children = args[0]
+                child = children.get(_format,
+                                     children.get(self.DEFAULT_VARIANT))
+                if child:
+                    child.replay(drawer, _format)
+            else:
+                getattr(drawer, name)(*args, **kwargs)
+
+    def render(self, _format, filename, size=None, **kwargs):
+        """Replay operations into a drawer of the format, and save it"""
+        if kwargs.get('antialias'):
+            # operations are recorded at 1x; supersample each shape instead
+            kwargs['antialias_mode'] = 'primitive'
+
+        drawer = imagedraw.create(_format, filename, filters=['linejump'],
+                                  **kwargs)
+        drawer.set_canvas_size(self.pagesize)
+        self.replay(drawer, _format)
+        return drawer.save(filename, size, _format.upper())
+
+    def dump(self, stream):
+        pickle.dump((self.pagesize, self.operations), stream, protocol=2)
+
+    def save(self, filename, size, _format):
+        # Ignore size and format parameter; compatibility for ImageDrawEx.
+        if filename:
+            self.filename = filename
+
+        if self.filename:
+            with open(self.filename, 'wb') as stream:
+                self.dump(stream)
+
+        return self
+
+
+def render_pages(displaylists, _format, filename, **kwargs):
+    """Replay display lists as pages of one document (PDF only)"""
+    from blockdiag.imagedraw.filters.linejump import LineJumpDrawFilter
+
+    drawer = imagedraw.create(_format, filename, **kwargs)
+    if not hasattr(drawer, 'new_page'):
+        msg = "%s images could not have multiple pages." % _format.upper()
+        raise RuntimeError(msg)
+
+    for displaylist in displaylists:
+        drawer.new_page(displaylist.pagesize)
+        page = LineJumpDrawFilter(drawer, 0)  # jumps are resolved per page
+        displaylist.replay(page, _format)
+        page.flush()
+
+    return drawer.save(filename, None, _format.upper())
+
+
+def load(stream):
+    """Load display list from the stream written by DisplayList.dump()"""
+    displaylist = DisplayList()
+    pagesize, operations = pickle.load(stream)
+    displaylist.set_canvas_size(pagesize)
+    displaylist.operations = operations
+    return displaylist
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from __future__ import division
+import os
+import math
+from PIL import Image
+from blockdiag.imagedraw.png import TiledImageDrawEx
+from blockdiag.utils import Size
+
+DZI_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008"
+       Format="png" Overlap="0" TileSize="%(tilesize)d">
+  <Size Width="%(width)d" Height="%(height)d"/>
+</Image>
+'''
+
+# options of raster drawers which are passed to worker processes
+RASTER_OPTIONS = ('transparency', 'color', 'scale_ratio', 'antialias',
+                  'antialias_mode', 'supersampling', 'shadow_compositing')
+
+# state of worker process (set up by init_worker)
+worker = None
+
+
+class TileRenderer(object):
+    def __init__(self, tiledir, tilesize, size, options, operations):
+        self.tiledir = tiledir
+        self.tilesize = tilesize
+        self.drawer = TiledImageDrawEx(None, **options)
+        self.drawer.set_canvas_size(size)
+        self.drawer.operations = operations
+
+    def level_size(self, level, maxlevel):
+        scale = 2 ** (maxlevel - level)
+        width, height = self.drawer.canvas_size
+        return Size(int(math.ceil(width / scale)),
+                    int(math.ceil(height / scale)))
+
+    def tilepath(self, level, col, row):
+        return os.path.join(self.tiledir, str(level), '%d_%d.png' % (col, row))
+
+    def render_row(self, level, row):
+        """Render a row of tiles of the largest level from operations"""
+        width, height = self.drawer.canvas_size
+        top = row * self.tilesize
+        bottom = min(height, top + self.tilesize)
+
+        band = self.drawer.render_band(top, bottom)
+        for col, left in enumerate(range(0, width, self.tilesize)):
+            right = min(width, left + self.tilesize)
+            tile = band.crop((left, 0, right, bottom - top))
+            tile.save(self.tilepath(level, col, row), 'PNG')
+
+    def shrink_row(self, level, row, maxlevel):
+        """Build a row of tiles by reducing tiles of the upper level"""
+        width, height = self.level_size(level + 1, maxlevel)
+        cols = int(math.ceil(width / self.tilesize))
+        rows = int(math.ceil(height / self.tilesize))
+
+        for col in range(int(math.ceil(cols / 2))):
+            tiles = {}
+            for x in (col * 2, col * 2 + 1):
+                for y in (row * 2, row * 2 + 1):
+                    if x < cols and y < rows:
+                        tiles[(x, y)] = Image.open(self.tilepath(level + 1,
+                                                                 x, y))
+
+            first = tiles[(col * 2, row * 2)]
+            right = tiles.get((col * 2 + 1, row * 2))
+            below = tiles.get((col * 2, row * 2 + 1))
+            size = (first.size[0] + (right.size[0] if right else 0),
+                    first.size[1] + (below.size[1] if below else 0))
+
+            image = Image.new(first.mode, size)
+            for (x, y), tile in tiles.items():
+                image.paste(tile, ((x - col * 2) * self.tilesize,
+                                   (y - row * 2) * self.tilesize))
+
+            size = (int(math.ceil(size[0] / 2)), int(math.ceil(size[1] / 2)))
+            image = image.resize(size, Image.ANTIALIAS)
+            image.save(self.tilepath(level, col, row), 'PNG')
+
+
+def init_worker(*args):
+    global worker
+    worker = TileRenderer(*args)
+
+
+def render_row(args):
+    worker.render_row(*args)
+
+
+def shrink_row(args):
+    worker.shrink_row(*args)
+
+
+class DeepZoomImageDraw(TiledImageDrawEx):
+    """Drawer for Deep Zoom images (tile pyramid of PNG images).
+
+    save() writes a DZI descriptor (``foo.dzi``) and tiles into the
+    ``foo_files/<level>/<col>_<row>.png``.  Tiles of the largest level are
+    rendered from the recorded operations in parallel processes, and then
+    tiles of smaller levels are built by reducing them.
+    """
+    TILE_SIZE = 256
+
+    def __init__(self, filename, **kwargs):
+        if kwargs.get('antialias'):
+            # pages are rasterized by tiles; supersample each shape instead
+            kwargs['antialias_mode'] = 'primitive'
+
+        self.tilesize = kwargs.get('tilesize') or self.TILE_SIZE
+        self.processes = kwargs.get('processes')
+        kwargs['tile_height'] = self.tilesize
+        super(DeepZoomImageDraw, self).__init__(filename, **kwargs)
+
+    def resizeCanvas(self, size):
+        raise RuntimeError("Deep Zoom image could not be resized.")
+
+    def save(self, filename, size, _format):
+        # size is ignored; deep zoom images hold all of the resolutions
+        if filename:
+            self.filename = filename
+        if self.filename is None:
+            raise RuntimeError("Deep Zoom image requires output filename.")
+
+        tiledir = os.path.splitext(self.filename)[0] + '_files'
+        width, height = self.canvas_size
+        maxlevel = int(math.ceil(math.log(max(width, height, 1), 2)))
+        for level in range(maxlevel + 1):
+            path = os.path.join(tiledir, str(level))
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        options = dict((key, value) for key, value in self.options.items()
+                       if key in RASTER_OPTIONS)
+        args = (tiledir, self.tilesize, self.canvas_size, options,
+                self.operations)
+        rows = int(math.ceil(height / self.tilesize))
+        tasks = [(render_row, [(maxlevel, row) for row in range(rows)])]
+        for level in range(maxlevel - 1, -1, -1):
+            rows = int(math.ceil(rows / 2))
+            tasks.append((shrink_row, [(level, row, maxlevel)
+                                       for row in range(rows)]))
+
+        self.run(tasks, args)
+
+        with open(self.filename, 'w') as fd:
+            fd.write(DZI_TEMPLATE % dict(tilesize=self.tilesize,
+                                         width=width, height=height))
+
+    def run(self, tasks, args):
+        pool = None
+        if self.processes != 1:
+            try:
+                from multiprocessing import Pool, current_process
+                # workers of batch mode (daemonic) could not have children
+                if not current_process().daemon:
+                    pool = Pool(self.processes, init_worker, args)
+            except (ImportError, OSError, AssertionError):
+                pass  # no multiprocessing support; render in this process
+
+        try:
+            if pool is None:
+                init_worker(*args)
+
+            # levels should be built in order; rows of a level are parallel
+            for fn, params in tasks:
+                if pool is None:
+                    for param in params:
+                        fn(param)
+                else:
+                    pool.map(fn, params)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+
+def setup(self):
+    from blockdiag.imagedraw import install_imagedrawer
+    install_imagedrawer('dzi', DeepZoomImageDraw)
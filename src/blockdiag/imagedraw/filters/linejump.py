@@ -150,6 +150,11 @@ class LineJumpDrawFilter(LazyReceiver):
                     insort(self.ytree, (min(st.y, ed.y), +1, (st, ed)))
 
     def save(self, *args, **kwargs):
+        self.flush()
+        return self.target.save(*args, **kwargs)
+
+    def flush(self):
+        """Draw recorded lines (with jumps) into the target drawer"""
         # Search crosspoints
         from bisect import insort, bisect_left, bisect_right
         xtree = []
@@ -169,4 +174,3 @@ class LineJumpDrawFilter(LazyReceiver):
                     self.y_cross.setdefault(x, set()).add(y)
 
         self._run()
-        return self.target.save(*args, **kwargs)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from blockdiag.utils import Box, XY
+
+
+class ShiftDrawFilter(object):
+    """Drawer proxy which translates coordinates of shapes by (x, y)"""
+
+    def __init__(self, target, x, y):
+        self.target = target
+        self.offset = XY(x, y)
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def _shift(self, value):
+        x, y = self.offset
+        if isinstance(value, (Box, XY)):
+            return value.shift(x, y)
+        elif isinstance(value[0], (int, float)):
+            return XY(value[0] + x, value[1] + y)
+        else:
+            return [self._shift(pt) for pt in value]
+
+    def line(self, xy, **kwargs):
+        self.target.line(self._shift(xy), **kwargs)
+
+    def rectangle(self, box, **kwargs):
+        self.target.rectangle(self._shift(box), **kwargs)
+
+    def polygon(self, xy, **kwargs):
+        self.target.polygon(self._shift(xy), **kwargs)
+
+    def arc(self, box, start, end, **kwargs):
+        self.target.arc(self._shift(box), start, end, **kwargs)
+
+    def ellipse(self, box, **kwargs):
+        self.target.ellipse(self._shift(box), **kwargs)
+
+    def path(self, pd, **kwargs):
+        # pathdata holds serialized commands; let the backend translate it
+        self.target.path(pd, shift=self.offset, **kwargs)
+
+    def image(self, box, url):
+        self.target.image(self._shift(box), url)
+
+    def text(self, xy, string, font, **kwargs):
+        self.target.text(self._shift(xy), string, font, **kwargs)
+
+    def textarea(self, box, string, font, **kwargs):
+        self.target.textarea(self._shift(box), string, font, **kwargs)
@@ -21,40 +21,59 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from blockdiag.imagedraw import base
 from blockdiag.imagedraw.utils import cached
-from blockdiag.utils import urlutil, Box, Size
+from blockdiag.utils import urlcache, urlutil, Box, Size
 from blockdiag.utils.fontmap import parse_fontpath
 from blockdiag.utils.compat import u, string_types
 
 
+def register_font(font):
+    # fonts are registered to reportlab process-wide; parse each file once
+    if font.path not in pdfmetrics.getRegisteredFontNames():
+        path, index = parse_fontpath(font.path)
+        if index:
+            ttfont = TTFont(font.path, path, subfontIndex=index)
+        else:
+            ttfont = TTFont(font.path, path)
+        pdfmetrics.registerFont(ttfont)
+
+
 class PDFImageDraw(base.ImageDraw):
     baseline_text_rendering = True
 
     def __init__(self, filename, **kwargs):
         self.filename = filename
-        self.canvas = None
-        self.fonts = {}
+        self._canvas = None
+        self.set_canvas_size(Size(1, 1))
+
+    @property
+    def canvas(self):
+        # create canvas on drawing; measuring texts does not require it
+        if self._canvas is None:
+            self._canvas = canvas.Canvas(self.filename, pagesize=self.size)
 
-        self.set_canvas_size(Size(1, 1))  # This line make textsize() workable
+        return self._canvas
 
     def set_canvas_size(self, size):
-        self.canvas = canvas.Canvas(self.filename, pagesize=size)
+        self._canvas = None
         self.size = size
 
-    def set_font(self, font):
+    def new_page(self, size):
+        """Start next page; fonts and images are shared by the pages"""
+        if self._canvas is not None:
+            self._canvas.showPage()
+            self._canvas.setPageSize(size)
+
+        self.size = size
+
+    def load_font(self, font):
         if font.path is None:
             msg = "Could not detect fonts, use --font opiton\n"
             raise RuntimeError(msg)
 
-        if font.path not in self.fonts:
-            path, index = parse_fontpath(font.path)
-            if index:
-                ttfont = TTFont(font.path, path, subfontIndex=index)
-            else:
-                ttfont = TTFont(font.path, path)
-            pdfmetrics.registerFont(ttfont)
-
-            self.fonts[font.path] = ttfont
+        register_font(font)
 
+    def set_font(self, font):
+        self.load_font(font)
         self.canvas.setFont(font.path, font.size)
 
     def set_render_params(self, **kwargs):
@@ -130,8 +149,8 @@ class PDFImageDraw(base.ImageDraw):
 
     @cached
     def textlinesize(self, string, font):
-        self.set_font(font)
-        width = self.canvas.stringWidth(string, font.path, font.size)
+        self.load_font(font)
+        width = pdfmetrics.stringWidth(string, font.path, font.size)
         return Size(int(math.ceil(width)), font.size)
 
     def text(self, xy, string, font, **kwargs):
@@ -156,22 +175,24 @@ class PDFImageDraw(base.ImageDraw):
                 box = Box(box.y1, -box.x2, box.y2, -box.x1)
                 box = box.shift(x=-self.size.y, y=self.size.y)
 
-        self.set_font(font)
-        lines = self.textfolder(box, string, font, **kwargs)
+        fontsize = self.fit_fontsize(box, string, font, **kwargs)
+        if fontsize > 0:
+            if fontsize != font.size:
+                font = font.duplicate()
+                font.size = fontsize
 
-        if kwargs.get('outline'):
-            outline = kwargs.get('outline')
-            self.rectangle(lines.outlinebox, fill='white', outline=outline)
+            self.set_font(font)
+            lines = self.textfolder(box, string, font, **kwargs)
 
-        rendered = False
-        for string, xy in lines.lines:
-            self.text(xy, string, font, **kwargs)
-            rendered = True
-        self.canvas.restoreState()
+            if kwargs.get('outline'):
+                outline = kwargs.get('outline')
+                self.rectangle(lines.outlinebox, fill='white',
+                               outline=outline)
+
+            for string, xy in lines.lines:
+                self.text(xy, string, font, **kwargs)
 
-        if not rendered and font.size > 0:
-            font.size = int(font.size * 0.8)
-            self.textarea(box, string, font, **kwargs)
+        self.canvas.restoreState()
 
     def line(self, xy, **kwargs):
         self.set_stroke_color(kwargs.get('fill', 'none'))
@@ -216,7 +237,7 @@ class PDFImageDraw(base.ImageDraw):
         if urlutil.isurl(url):
             from reportlab.lib.utils import ImageReader
             try:
-                url = ImageReader(url)
+                url = ImageReader(urlcache.open_url(url))
             except:
                 msg = u("WARNING: Could not retrieve: %s\n") % url
                 sys.stderr.write(msg)
@@ -14,9 +14,11 @@
 #  limitations under the License.
 
 from __future__ import division
+import os
 import re
 import sys
 import math
+from io import BytesIO
 from itertools import tee
 try:
     from future_builtins import zip
@@ -25,9 +27,12 @@ except ImportError:
 from functools import partial, wraps
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from blockdiag.imagedraw import base
+from blockdiag.imagedraw.filters.shift import ShiftDrawFilter
 from blockdiag.imagedraw.utils import cached
 from blockdiag.imagedraw.utils.ellipse import dots as ellipse_dots
-from blockdiag.utils import urlutil, Box, Size, XY
+from blockdiag.imagedraw.utils.pngstream import PNGStreamWriter
+from blockdiag.utils import urlcache, urlutil, Box, Size, XY
+from blockdiag.utils.cache import LRUCache
 from blockdiag.utils.compat import u
 from blockdiag.utils.fontmap import parse_fontpath, FontMap
 from blockdiag.utils.myitertools import istep, stepslice
@@ -102,20 +107,57 @@ def style2cycle(style, thick):
     return length
 
 
+# loaded TrueType fonts; shared between drawers in the process
+ttfonts = LRUCache(maxsize=64)
+default_font = None
+
+# scaled images of texts rendered with default font
+text_images = LRUCache(maxsize=1024)
+
+# decoded and resized images of icons; shared between drawers
+icon_images = LRUCache(maxsize=128)
+
+
 def ttfont_for(font):
     if font.path:
         path, index = parse_fontpath(font.path)
-        if index:
-            ttfont = ImageFont.truetype(path, font.size, index=index)
-        else:
-            ttfont = ImageFont.truetype(path, font.size)
+        key = (path, index, font.size)
+
+        ttfont = ttfonts.get(key)
+        if ttfont is None:
+            if index:
+                ttfont = ImageFont.truetype(path, font.size, index=index)
+            else:
+                ttfont = ImageFont.truetype(path, font.size)
+
+            ttfonts.set(key, ttfont)
     else:
         ttfont = None
 
     return ttfont
 
 
+def get_textlinesize(string, font):
+    global default_font
+
+    ttfont = ttfont_for(font)
+    if ttfont is None:
+        if default_font is None:
+            default_font = ImageFont.load_default()
+        size = default_font.getsize(string)
+
+        font_ratio = font.size * 1.0 / FontMap.BASE_FONTSIZE
+        size = Size(int(size[0] * font_ratio),
+                    int(size[1] * font_ratio))
+    else:
+        size = Size(*ttfont.getsize(string))
+
+    return size
+
+
 class ImageDrawExBase(base.ImageDraw):
+    fontmode = "1"
+
     def __init__(self, filename, **kwargs):
         self.filename = filename
         self.transparency = kwargs.get('transparency')
@@ -274,18 +316,7 @@ class ImageDrawExBase(base.ImageDraw):
 
     @cached
     def textlinesize(self, string, font):
-        ttfont = ttfont_for(font)
-        if ttfont is None:
-            size = self.draw.textsize(string, font=None)
-
-            font_ratio = font.size * 1.0 / FontMap.BASE_FONTSIZE
-            size = Size(int(size[0] * font_ratio),
-                        int(size[1] * font_ratio))
-        else:
-            size = self.draw.textsize(string, font=ttfont)
-            size = Size(*size)
-
-        return size
+        return get_textlinesize(string, font)
 
     def text(self, xy, string, font, **kwargs):
         fill = kwargs.get('fill')
@@ -295,27 +326,34 @@ class ImageDrawExBase(base.ImageDraw):
             if self.scale_ratio == 1 and font.size == FontMap.BASE_FONTSIZE:
                 self.draw.text(xy, string, fill=fill)
             else:
-                size = self.draw.textsize(string)
-                image = Image.new('RGBA', size)
-                draw = ImageDraw.Draw(image)
-                draw.text((0, 0), string, fill=fill)
-                del draw
-
-                basesize = (size[0] * self.scale_ratio,
-                            size[1] * self.scale_ratio)
-                text_image = image.resize(basesize, Image.ANTIALIAS)
+                text_image = self.scaled_text_image(string, fill)
                 self.paste(text_image, xy, text_image)
         else:
-            size = self.draw.textsize(string, font=ttfont)
-
-            # Generate mask to support BDF(bitmap font)
-            mask = Image.new('1', size)
-            draw = ImageDraw.Draw(mask)
-            draw.text((0, 0), string, fill='white', font=ttfont)
-
-            # Rendering text
-            filler = Image.new('RGB', size, fill)
-            self.paste(filler, xy, mask)
+            # render glyphs onto the canvas directly
+            self.draw.fontmode = self.fontmode
+            self.draw.text(xy, string, fill=fill, font=ttfont)
+
+    def scaled_text_image(self, string, fill):
+        try:
+            key = (string, fill, self.scale_ratio)
+            text_image = text_images.get(key)
+        except TypeError:  # unhashable color
+            key = text_image = None
+
+        if text_image is None:
+            size = self.draw.textsize(string)
+            image = Image.new('RGBA', size)
+            draw = ImageDraw.Draw(image)
+            draw.text((0, 0), string, fill=fill)
+            del draw
+
+            basesize = (size[0] * self.scale_ratio,
+                        size[1] * self.scale_ratio)
+            text_image = image.resize(basesize, Image.ANTIALIAS)
+            if key is not None:
+                text_images.set(key, text_image)
+
+        return text_image
 
     def textarea(self, box, string, font, **kwargs):
         if 'rotate' in kwargs and kwargs['rotate'] != 0:
@@ -336,45 +374,26 @@ class ImageDrawExBase(base.ImageDraw):
             self.paste(filler, box.topleft, text._image.rotate(angle))
             return
 
+        fontsize = self.fit_fontsize(box, string, font, **kwargs)
+        if fontsize <= 0:
+            return
+        elif fontsize != font.size:
+            font = font.duplicate()
+            font.size = fontsize
+
         lines = self.textfolder(box, string, font, **kwargs)
 
         if kwargs.get('outline'):
             outline = kwargs.get('outline')
             self.rectangle(lines.outlinebox, fill='white', outline=outline)
 
-        rendered = False
         for string, xy in lines.lines:
             self.text(xy, string, font, **kwargs)
-            rendered = True
-
-        if not rendered and font.size > 0:
-            _font = font.duplicate()
-            _font.size = int(font.size * 0.8)
-            self.textarea(box, string, _font, **kwargs)
 
     def image(self, box, url):
-        if urlutil.isurl(url):
-            try:
-                from io import BytesIO as StringIO
-            except ImportError:
-                from cStringIO import StringIO
-            try:
-                from urllib.request import urlopen
-            except ImportError:
-                from urllib import urlopen
-
-            try:
-                url = StringIO(urlopen(url).read())
-            except:
-                msg = u("WARNING: Could not retrieve: %s\n") % url
-                sys.stderr.write(msg)
-                return
-        image = Image.open(url)
-
-        # resize image.
-        w = min([box.width, image.size[0] * self.scale_ratio])
-        h = min([box.height, image.size[1] * self.scale_ratio])
-        image.thumbnail((w, h), Image.ANTIALIAS)
+        image = self.fitted_image(url, (box.width, box.height))
+        if image is None:
+            return
 
         # centering image.
         w, h = image.size
@@ -390,6 +409,39 @@ class ImageDrawExBase(base.ImageDraw):
 
         self.paste(image, (x, y))
 
+    def fitted_image(self, url, size):
+        """Return decoded image resized to fit the size (cached)"""
+        if urlutil.isurl(url):
+            try:
+                # revalidated by urlcache; reload if content is modified
+                content, meta = urlcache.get_entry(url)
+            except RuntimeError:
+                msg = u("WARNING: Could not retrieve: %s\n") % url
+                sys.stderr.write(msg)
+                return None
+
+            source = BytesIO(content)
+            stamp = meta['digest']
+        else:
+            source = url
+            try:
+                stamp = os.stat(url).st_mtime  # reload modified images
+            except OSError:
+                stamp = None
+
+        key = (url, stamp, size, self.scale_ratio)
+        image = icon_images.get(key)
+        if image is None:
+            image = Image.open(source)
+
+            # resize image.
+            w = min([size[0], image.size[0] * self.scale_ratio])
+            h = min([size[1], image.size[1] * self.scale_ratio])
+            image.thumbnail((w, h), Image.ANTIALIAS)
+            icon_images.set(key, image)
+
+        return image
+
     def save(self, filename, size, _format):
         if filename:
             self.filename = filename
@@ -416,8 +468,55 @@ class ImageDrawExBase(base.ImageDraw):
         return image
 
 
-def blurred(fn):
+# blurred shadow images shared between drawers (and renderings)
+shadow_sprites = LRUCache(maxsize=128)
+
+
+class ShadowLayer(object):
+    """Shared canvas for blurred shapes.
+
+    All shapes are recorded, and then drawn onto one transparent canvas
+    covering them.  The canvas is blurred and composited to the target
+    image at once.
+    """
     PADDING = 16
+    BLUR_RADIUS = 3.3  # nearly equals to 15 times of SMOOTH_MORE filter
+
+    def __init__(self, size):
+        self.size = size
+        self.shapes = []
+        self.bounds = None
+
+    def draw(self, name, box, *args, **kwargs):
+        self.shapes.append((name, args, kwargs))
+
+        if self.bounds is None:
+            self.bounds = Box(*box)
+        else:
+            self.bounds = Box(min(self.bounds.x1, box.x1),
+                              min(self.bounds.y1, box.y1),
+                              max(self.bounds.x2, box.x2),
+                              max(self.bounds.y2, box.y2))
+
+    def blurred_image(self):
+        width, height = self.size
+        box = Box(max(0, int(self.bounds.x1) - self.PADDING),
+                  max(0, int(self.bounds.y1) - self.PADDING),
+                  min(width, int(self.bounds.x2) + self.PADDING),
+                  min(height, int(self.bounds.y2) + self.PADDING))
+
+        drawer = ImageDrawExBase(None, transparency=True)
+        drawer.set_canvas_size(Size(box.width, box.height))
+        layer = ShiftDrawFilter(drawer, -box.x1, -box.y1)
+        for name, args, kwargs in self.shapes:
+            getattr(layer, name)(*args, **kwargs)
+
+        blur = ImageFilter.GaussianBlur(self.BLUR_RADIUS)
+        return drawer._image.filter(blur), box.topleft
+
+
+def blurred(fn):
+    PADDING = ShadowLayer.PADDING
 
     def get_shape_box(*args):
         if fn.__name__ == 'polygon':
@@ -435,15 +534,35 @@ def blurred(fn):
         else:
             return box.shift(-dx, -dy)
 
+    def get_sprite_key(self, *args, **kwargs):
+        if fn.__name__ == 'polygon':
+            shape = tuple(tuple(pt) for pt in args[0])
+        else:
+            shape = tuple(args[0])
+
+        return (fn.__name__, shape, tuple(sorted(kwargs.items())),
+                self.scale_ratio)
+
     def create_shadow(self, size, *args, **kwargs):
-        drawer = ImageDrawExBase(self.filename, transparency=True)
-        drawer.set_canvas_size(size)
-        getattr(drawer, fn.__name__)(*args, **kwargs)
+        try:
+            key = get_sprite_key(self, *args, **kwargs)
+            shadow = shadow_sprites.get(key)
+        except TypeError:  # unhashable parameters
+            key = shadow = None
 
-        for _ in range(15):
-            drawer._image = drawer._image.filter(ImageFilter.SMOOTH_MORE)
+        if shadow is None:
+            drawer = ImageDrawExBase(self.filename, transparency=True)
+            drawer.set_canvas_size(size)
+            getattr(drawer, fn.__name__)(*args, **kwargs)
 
-        return drawer._image
+            for _ in range(15):
+                drawer._image = drawer._image.filter(ImageFilter.SMOOTH_MORE)
+
+            shadow = drawer._image
+            if key is not None:
+                shadow_sprites.set(key, shadow)
+
+        return shadow
 
     @wraps(fn)
     def func(self, *args, **kwargs):
@@ -451,6 +570,12 @@ def blurred(fn):
 
         if kwargs.get('filter') not in ('blur', 'transp-blur'):
             return fn(self, *args, **kwargs)
+        elif self.shadow_compositing == 'layer':
+            if self.shadow_layer is None:
+                self.shadow_layer = ShadowLayer(self._image.size)
+
+            box = get_shape_box(*args)
+            self.shadow_layer.draw(fn.__name__, box, *args, **kwargs)
         else:
             box = get_shape_box(*args)
             args[0] = get_abs_coordinate(box, *args)
@@ -463,20 +588,296 @@ def blurred(fn):
     return func
 
 
+def smoothed(fn):
+    """Anti-alias a shape by supersampling only the area it covers.
+
+    The shape is drawn onto a small transparent canvas enlarged by
+    ``self.supersampling``, and then the canvas is reduced and composited
+    to the target image.  Memory usage stays near the size of 1x canvas.
+    """
+    def get_points(shape):
+        if fn.__name__ in ('line', 'polygon'):
+            return list(point_pairs(shape))
+        else:
+            return [shape[:2], shape[2:]]
+
+    @wraps(fn)
+    def func(self, *args, **kwargs):
+        if not self.supersampling:
+            return fn(self, *args, **kwargs)
+        elif (fn.__name__ in ('ellipse', 'rectangle') and
+              kwargs.get('fill') == kwargs.get('outline')):
+            # patches to cover the joints of compound shapes (cf. cloud);
+            # their blended edges would leave seams on the shape
+            return fn(self, *args, **kwargs)
+
+        ratio = self.supersampling
+        points = get_points(args[0])
+        if kwargs.get('thick') is not None:
+            thick = kwargs['thick']
+            kwargs['thick'] = thick * ratio
+        else:
+            thick = kwargs.get('width') or 1
+            kwargs.pop('thick', None)
+        kwargs['width'] = thick * ratio
+
+        padding = int(math.ceil(thick / 2.0)) + 2
+        x = int(min(pt[0] for pt in points)) - padding
+        y = int(min(pt[1] for pt in points)) - padding
+        width = int(math.ceil(max(pt[0] for pt in points))) - x + padding + 1
+        height = int(math.ceil(max(pt[1] for pt in points))) - y + padding + 1
+
+        # map each pixel of canvas to the center of supersampled pixels
+        def scale(pt):
+            return XY((pt[0] - x) * ratio + (ratio - 1) // 2,
+                      (pt[1] - y) * ratio + (ratio - 1) // 2)
+
+        points = [scale(pt) for pt in points]
+        if fn.__name__ in ('line', 'polygon'):
+            shape = points
+        else:
+            shape = Box(points[0].x, points[0].y, points[1].x, points[1].y)
+
+        drawer = ImageDrawExBase(None, scale_ratio=ratio)
+        drawer._image = Image.new('RGBA', (width * ratio, height * ratio),
+                                  (0, 0, 0, 0))
+        drawer.draw = ImageDraw.Draw(drawer._image)
+        getattr(drawer, fn.__name__)(shape, *args[1:], **kwargs)
+
+        image = drawer._image.resize((width, height), Image.ANTIALIAS)
+        self.paste(image, (x, y), image)
+
+    return func
+
+
 class ImageDrawEx(ImageDrawExBase):
+    def __init__(self, filename, **kwargs):
+        # shadow_compositing: 'shape' blurs each shape separately (sprites
+        # are cached); 'layer' draws all blurred shapes onto a shared layer
+        # and blurs it once.
+        self.shadow_compositing = kwargs.get('shadow_compositing') or 'shape'
+        self.shadow_layer = None
+        self._draw = None
+
+        # supersampling: factor of per-primitive anti-aliasing
+        # (None means shapes are drawn onto the canvas as is)
+        if kwargs.get('parent'):
+            self.supersampling = getattr(kwargs['parent'], 'supersampling',
+                                         None)
+        elif (kwargs.get('antialias') and
+              kwargs.get('antialias_mode') == 'primitive'):
+            self.supersampling = kwargs.get('supersampling') or 2
+        else:
+            self.supersampling = None
+
+        if self.supersampling:
+            self.fontmode = "L"
+
+        super(ImageDrawEx, self).__init__(filename, **kwargs)
+
+    @property
+    def draw(self):
+        # composite pending shadows before drawing over them
+        self.flush_shadows()
+        return self._draw
+
+    @draw.setter
+    def draw(self, value):
+        self._draw = value
+
+    def flush_shadows(self):
+        if self.shadow_layer is not None:
+            layer, self.shadow_layer = self.shadow_layer, None
+            image, xy = layer.blurred_image()
+            self.paste(image, xy, image)
+
+    def set_canvas_size(self, size):
+        self.shadow_layer = None
+        super(ImageDrawEx, self).set_canvas_size(size)
+
+    def paste(self, image, pt, mask=None):
+        self.flush_shadows()
+        super(ImageDrawEx, self).paste(image, pt, mask)
+
+    def resizeCanvas(self, size):
+        self.flush_shadows()
+        super(ImageDrawEx, self).resizeCanvas(size)
+
+    @smoothed
+    def arc(self, box, start, end, **kwargs):
+        super(ImageDrawEx, self).arc(box, start, end, **kwargs)
+
     @blurred
+    @smoothed
     def ellipse(self, box, **kwargs):
         super(ImageDrawEx, self).ellipse(box, **kwargs)
 
+    @smoothed
+    def line(self, xy, **kwargs):
+        super(ImageDrawEx, self).line(xy, **kwargs)
+
     @blurred
+    @smoothed
     def rectangle(self, box, **kwargs):
         super(ImageDrawEx, self).rectangle(box, **kwargs)
 
     @blurred
+    @smoothed
     def polygon(self, xy, **kwargs):
         super(ImageDrawEx, self).polygon(xy, **kwargs)
 
+    def save(self, filename, size, _format):
+        self.flush_shadows()
+        return super(ImageDrawEx, self).save(filename, size, _format)
+
+
+class TiledImageDrawEx(ImageDrawEx):
+    """PNG drawer which rasterizes the page band by band.
+
+    Draw operations are recorded with their vertical extents, and replayed
+    onto a canvas of `tile_height` rows for each band of the page on save.
+    Encoded rows are streamed to the output, so peak memory is bounded by
+    the band instead of the whole page.
+    """
+    TILE_HEIGHT = 256
+    MARGIN = ShadowLayer.PADDING * 2  # keeps blurred shadows seamless
+
+    def __init__(self, filename, **kwargs):
+        self.options = dict(kwargs)
+        self.tile_height = kwargs.get('tile_height') or self.TILE_HEIGHT
+        self.operations = []
+        self.resized = False
+        super(TiledImageDrawEx, self).__init__(filename, **kwargs)
+
+    def set_canvas_size(self, size):
+        self.canvas_size = Size(*size)
+        self.operations = []
+        self.resized = False
+
+        # small canvas for measuring texts; shapes are never drawn onto it
+        super(TiledImageDrawEx, self).set_canvas_size(Size(1, 1))
+
+    def resizeCanvas(self, size):
+        # whole of the page is needed to resize; give up rendering by bands
+        self.canvas_size = Size(*size)
+        self.resized = True
+        self.record('resizeCanvas', None, size)
+
+    def record(self, name, shape, *args, **kwargs):
+        if shape is None:
+            extent = None
+        else:
+            if isinstance(shape, Box):
+                ylist = [shape.y1, shape.y2]
+            else:
+                ylist = [pt[1] for pt in point_pairs(shape)]
+
+            thick = kwargs.get('thick') or kwargs.get('width') or 1
+            padding = ShadowLayer.PADDING + thick
+            extent = (min(ylist) - padding, max(ylist) + padding)
+
+        self.operations.append((name, extent, args, kwargs))
+
+    def arc(self, box, start, end, **kwargs):
+        self.record('arc', box, box, start, end, **kwargs)
+
+    def ellipse(self, box, **kwargs):
+        self.record('ellipse', box, box, **kwargs)
+
+    def line(self, xy, **kwargs):
+        self.record('line', xy, xy, **kwargs)
+
+    def rectangle(self, box, **kwargs):
+        self.record('rectangle', box, box, **kwargs)
+
+    def polygon(self, xy, **kwargs):
+        self.record('polygon', xy, xy, **kwargs)
+
+    def text(self, xy, string, font, **kwargs):
+        self.record('text', None, xy, string, font, **kwargs)
+
+    def textarea(self, box, string, font, **kwargs):
+        self.record('textarea', box, box, string, font, **kwargs)
+
+    def image(self, box, url):
+        self.record('image', box, box, url)
+
+    def replay(self, drawer, top=None, bottom=None):
+        for name, extent, args, kwargs in self.operations:
+            if top is None or extent is None:
+                pass
+            elif extent[1] < top or bottom < extent[0]:
+                continue
+
+            getattr(drawer, name)(*args, **kwargs)
+
+    def render_band(self, top, bottom):
+        y1 = max(0, top - self.MARGIN)
+        y2 = min(self.canvas_size.height, bottom + self.MARGIN)
+
+        drawer = ImageDrawEx(None, **self.options)
+        drawer.set_canvas_size(Size(self.canvas_size.width, y2 - y1))
+        self.replay(ShiftDrawFilter(drawer, 0, -y1), y1, y2)
+        drawer.flush_shadows()
+
+        return drawer._image.crop((0, top - y1, self.canvas_size.width,
+                                   bottom - y1))
+
+    def save(self, filename, size, _format):
+        if filename:
+            self.filename = filename
+
+        if size is not None and tuple(size) == self.canvas_size:
+            size = None
+
+        if (self.resized or self.scale_ratio != 1 or _format != 'PNG' or
+                size is not None):
+            drawer = ImageDrawEx(self.filename, **self.options)
+            drawer.set_canvas_size(self.canvas_size)
+            self.replay(drawer)
+            return drawer.save(self.filename, size, _format)
+
+        if self.filename:
+            stream = open(self.filename, 'wb')
+        else:
+            from io import BytesIO
+            stream = BytesIO()
+
+        try:
+            if self.transparency:
+                mode = 'RGBA'
+            else:
+                mode = 'RGB'
+
+            writer = PNGStreamWriter(stream, self.canvas_size, mode)
+            height = self.canvas_size.height
+            for top in range(0, height, self.tile_height):
+                bottom = min(height, top + self.tile_height)
+                writer.write(self.render_band(top, bottom))
+            writer.close()
+
+            if self.filename:
+                image = None
+            else:
+                image = stream.getvalue()
+        except:
+            stream.close()
+            if self.filename:  # do not leave broken image
+                os.remove(self.filename)
+            raise
+        else:
+            stream.close()
+
+        return image
+
+
+def create_imagedrawer(filename, **kwargs):
+    if kwargs.get('tiled'):
+        return TiledImageDrawEx(filename, **kwargs)
+    else:
+        return ImageDrawEx(filename, **kwargs)
+
 
 def setup(self):
     from blockdiag.imagedraw import install_imagedrawer
-    install_imagedrawer('png', ImageDrawEx)
+    install_imagedrawer('png', create_imagedrawer)
@@ -49,20 +49,32 @@ class base(object):
 
     def addElement(self, element):
         self.elements.append(element)
+        return element
 
     def set_text(self, text):
         self.text = text
 
-    def to_xml(self, io, level=0):
+    def starttag(self, level=0):
         clsname = self.__class__.__name__
         indent = '  ' * level
 
-        io.write(u('%s<%s') % (indent, clsname))
+        tag = [u('%s<%s') % (indent, clsname)]
         for key in sorted(self.attributes):
             value = self.attributes[key]
             if value is not None:
-                io.write(u(' %s=%s') % (_escape(key), _quote(value)))
+                tag.append(u(' %s=%s') % (_escape(key), _quote(value)))
+
+        return ''.join(tag)
+
+    def endtag(self, level=0):
+        clsname = self.__class__.__name__
+        indent = '  ' * level
+        return u('%s</%s>\n') % (indent, clsname)
+
+    def to_xml(self, io, level=0):
+        clsname = self.__class__.__name__
 
+        io.write(self.starttag(level))
         if self.elements == []:
             if self.text is not None:
                 io.write(u(">%s</%s>\n") % (_escape(self.text), clsname))
@@ -76,7 +88,7 @@ class base(object):
 
             for e in self.elements:
                 e.to_xml(io, level + 1)
-            io.write(u('%s</%s>\n') % (indent, clsname))
+            io.write(self.endtag(level))
 
 
 class element(base):
@@ -101,15 +113,18 @@ class svg(base):
         self.nodoctype = kwargs.get('nodoctype', False)
         self.add_attribute('xmlns', 'http://www.w3.org/2000/svg')
 
-    def to_xml(self):
-        io = StringIO()
-
-        if not self.nodoctype:
+    def header(self):
+        if self.nodoctype:
+            return u('')
+        else:
             url = "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd"
-            io.write(u("<?xml version='1.0' encoding='UTF-8'?>\n"))
-            io.write(u('<!DOCTYPE svg PUBLIC ') +
-                     u('"-//W3C//DTD SVG 1.0//EN" "%s">\n') % url)
+            return (u("<?xml version='1.0' encoding='UTF-8'?>\n") +
+                    u('<!DOCTYPE svg PUBLIC ') +
+                    u('"-//W3C//DTD SVG 1.0//EN" "%s">\n') % url)
 
+    def to_xml(self):
+        io = StringIO()
+        io.write(self.header())
         super(svg, self).to_xml(io)
 
         return io.getvalue()
@@ -14,17 +14,25 @@
 #  limitations under the License.
 
 import re
+import gzip
 import base64
+from io import BytesIO
 from blockdiag.imagedraw import base as _base
 from blockdiag.imagedraw.simplesvg import (
     svg, svgclass, filter, title, desc, defs, g, a, text,
     rect, polygon, ellipse, path, pathdata, image
 )
 from blockdiag.imagedraw.utils import cached
+from blockdiag.imagedraw.utils.svgstream import (
+    SVGStreamWriter, CompactSVGStreamWriter
+)
 from blockdiag.imagedraw.utils.ellipse import endpoints as ellipse_endpoints
 from blockdiag.utils import urlutil, Box, XY, is_Pillow_available
+from blockdiag.utils.images import get_image_size
 
 feGaussianBlur = svgclass('feGaussianBlur')
+symbol = svgclass('symbol')
+use = svgclass('use')
 
 
 def rgb(color):
@@ -74,9 +82,18 @@ def drawing_params(kwargs):
     if 'filter' in kwargs:
         params['style'] = style(kwargs.get('filter'))
 
+    if kwargs.get('shift'):
+        params['transform'] = "translate(%d,%d)" % tuple(kwargs['shift'])
+
     return params
 
 
+def data_uri(url):
+    with open(url, 'rb') as fd:
+        string = fd.read()
+    return "data:;base64," + base64.b64encode(string).decode('ascii')
+
+
 class SVGImageDrawElement(_base.ImageDraw):
     self_generative_methods = ['group', 'anchor']
     supported_path = True
@@ -84,6 +101,9 @@ class SVGImageDrawElement(_base.ImageDraw):
 
     def __init__(self, svg, parent=None):
         self.svg = svg
+        if parent:
+            self.options = parent.options
+            self.symbols = parent.symbols
 
     def path(self, pd, **kwargs):
         fill = kwargs.get('fill')
@@ -106,11 +126,8 @@ class SVGImageDrawElement(_base.ImageDraw):
     @cached
     def textlinesize(self, string, font, **kwargs):
         if is_Pillow_available():
-            if not hasattr(self, '_pil_drawer'):
-                from blockdiag.imagedraw import png
-                self._pil_drawer = png.ImageDrawEx(None)
-
-            return self._pil_drawer.textlinesize(string, font)
+            from blockdiag.imagedraw import png
+            return png.get_textlinesize(string, font)
         else:
             from blockdiag.imagedraw.utils import textsize
             return textsize(string, font)
@@ -127,21 +144,21 @@ class SVGImageDrawElement(_base.ImageDraw):
         if 'rotate' in kwargs and kwargs['rotate'] != 0:
             self.rotated_textarea(box, string, font, **kwargs)
         else:
+            fontsize = self.fit_fontsize(box, string, font, **kwargs)
+            if fontsize <= 0:
+                return
+            elif fontsize != font.size:
+                font = font.duplicate()
+                font.size = fontsize
+
             lines = self.textfolder(box, string, font, **kwargs)
 
             if kwargs.get('outline'):
                 outline = kwargs.get('outline')
                 self.rectangle(lines.outlinebox, fill='white', outline=outline)
 
-            rendered = False
             for string, point in lines.lines:
                 self.text(point, string, font, **kwargs)
-                rendered = True
-
-            if not rendered and font.size > 0:
-                _font = font.duplicate()
-                _font.size = int(font.size * 0.8)
-                self.textarea(box, string, _font, **kwargs)
 
     def rotated_textarea(self, box, string, font, **kwargs):
         angle = int(kwargs['rotate']) % 360
@@ -162,8 +179,7 @@ class SVGImageDrawElement(_base.ImageDraw):
                        box[0] + box.width, box[1] + box.height)
 
         rotate = "rotate(%d,%d,%d)" % (angle, _box[0], _box[1])
-        group = g(transform="%s" % rotate)
-        self.svg.addElement(group)
+        group = self.svg.addElement(g(transform="%s" % rotate))
 
         elem = SVGImageDrawElement(group, self)
         elem.textarea(_box, string, font, **kwargs)
@@ -227,41 +243,96 @@ class SVGImageDrawElement(_base.ImageDraw):
         self.svg.addElement(pg)
 
     def image(self, box, url):
-        if not urlutil.isurl(url):
-            string = open(url, 'rb').read()
-            url = "data:;base64," + str(base64.b64encode(string))
-
-        im = image(url, box.x1, box.y1, box.width, box.height)
-        self.svg.addElement(im)
+        if urlutil.isurl(url) or self.options.get('external_images'):
+            im = image(url, box.x1, box.y1, box.width, box.height)
+            self.svg.addElement(im)
+        else:
+            # embed each image once; nodes refer it through <use>
+            if url not in self.symbols:
+                self.symbols[url] = self.embed_image(url)
+
+            symbol_id = self.symbols[url]
+            if symbol_id is None:  # size is unknown; embed to each box
+                im = image(data_uri(url), box.x1, box.y1,
+                           box.width, box.height)
+                self.svg.addElement(im)
+            else:
+                ref = use(x=box.x1, y=box.y1,
+                          width=box.width, height=box.height)
+                ref.add_attribute('xlink:href', '#' + symbol_id)
+                self.svg.addElement(ref)
+
+    def embed_image(self, url):
+        """Embed image as <symbol>; returns None if its size is unknown"""
+        try:
+            width, height = get_image_size(url)
+        except RuntimeError:
+            return None
+
+        symbol_id = 'image%d' % len(self.symbols)
+        sym = symbol(id=symbol_id, viewBox="0 0 %d %d" % (width, height))
+        sym.addElement(image(data_uri(url), 0, 0, width, height))
+        d = defs()
+        d.addElement(sym)
+        self.svg.addElement(d)
+
+        return symbol_id
 
     def anchor(self, url):
         a_node = a(url)
         a_node.add_attribute('xlink:href', url)
-        self.svg.addElement(a_node)
+        a_node = self.svg.addElement(a_node)
 
         return SVGImageDrawElement(a_node, self)
 
     def group(self):
-        group = g()
-        self.svg.addElement(group)
+        group = self.svg.addElement(g())
 
         return SVGImageDrawElement(group, self)
 
 
 class SVGImageDraw(SVGImageDrawElement):
+    """Drawer for SVG images.
+
+    Elements are serialized as soon as they are drawn (see SVGStreamWriter),
+    so the document tree is never held in memory.  Containers like anchors
+    are written when their children are drawn.
+
+    With ``compact`` option, styles are shared through CSS classes, edges
+    are merged and numbers are rounded to ``precision`` decimal places.
+    Images are compressed by gzip if the filename ends with ``.svgz``.
+
+    Local image files are embedded once, and drawn through ``<use>``
+    elements.  With ``external_images`` option, they are referred by path.
+    """
     def __init__(self, filename, **kwargs):
         super(SVGImageDraw, self).__init__(None)
 
         self.filename = filename
         self.options = kwargs
+        self.writer = None
+        self.symbols = {}
         self.set_canvas_size((0, 0))
 
     def set_canvas_size(self, size):
-        self.svg = svg(0, 0, size[0], size[1], **self.options)
+        if self.writer:
+            self.writer.discard()
+
+        self.symbols = {}  # id of embedded images
+        root = svg(0, 0, size[0], size[1], **self.options)
         uri = 'http://www.inkscape.org/namespaces/inkscape'
-        self.svg.add_attribute('xmlns:inkspace', uri)
+        root.add_attribute('xmlns:inkspace', uri)
         uri = 'http://www.w3.org/1999/xlink'
-        self.svg.add_attribute('xmlns:xlink', uri)
+        root.add_attribute('xmlns:xlink', uri)
+
+        if self.options.get('compact'):
+            precision = self.options.get('precision')
+            if precision is None:
+                precision = 2
+            self.writer = CompactSVGStreamWriter(root, precision=precision)
+        else:
+            self.writer = SVGStreamWriter(root)
+        self.svg = self.writer.root
 
         # inkspace's Gaussian filter
         if self.options.get('style') != 'blur':
@@ -287,12 +358,19 @@ class SVGImageDraw(SVGImageDrawElement):
             self.svg.attributes['width'] = size[0]
             self.svg.attributes['height'] = size[1]
 
-        image = self.svg.to_xml()
-
-        if self.filename:
-            open(self.filename, 'wb').write(image.encode('utf-8'))
-
-        return image
+        if self.filename and self.filename.lower().endswith('.svgz'):
+            fd = gzip.GzipFile(self.filename, 'wb')
+            try:
+                self.writer.save(fd)
+            finally:
+                fd.close()
+        elif self.filename:
+            with open(self.filename, 'wb') as fd:
+                self.writer.save(fd)
+        else:
+            stream = BytesIO()
+            self.writer.save(stream)
+            return stream.getvalue().decode('utf-8')
 
 
 def setup(self):
@@ -32,29 +32,51 @@ def splitlabel(string):
         yield re.sub('\x00', '\\\\', line).strip()
 
 
+def fitting_length(metrics, text, bound, measure='width', suffix=''):
+    """Find the length of the longest prefix of text which fits to bound.
+       Text sizes are measured O(log n) times using binary search.
+    """
+    lower, upper = 0, len(text)
+    while lower < upper:
+        length = (lower + upper + 1) // 2
+        textsize = metrics.textsize(text[0:length] + suffix)
+
+        if getattr(textsize, measure) <= bound:
+            lower = length
+        else:
+            upper = length - 1
+
+    return lower
+
+
 def splittext(metrics, text, bound, measure='width'):
     folded = []
     if text == '':
         folded.append(u(' '))
 
-    for i in range(len(text), 0, -1):
-        textsize = metrics.textsize(text[0:i])
-
-        if getattr(textsize, measure) <= bound:
-            folded.append(text[0:i])
-            if text[i:]:
-                folded += splittext(metrics, text[i:], bound, measure)
+    while text:
+        length = fitting_length(metrics, text, bound, measure)
+        if length == 0:
             break
 
+        if length < len(text):
+            # fold text at word boundary if possible
+            pos = text.rfind(' ', 0, length + 1)
+            if pos > 0 and text[0:pos].strip():
+                folded.append(text[0:pos].rstrip())
+                text = text[pos:].lstrip()
+                continue
+
+        folded.append(text[0:length])
+        text = text[length:]
+
     return folded
 
 
 def truncate_text(metrics, text, bound, measure='width'):
-    for i in range(len(text), 0, -1):
-        textsize = metrics.textsize(text[0:i] + ' ...')
-
-        if getattr(textsize, measure) <= bound:
-            return text[0:i] + ' ...'
+    length = fitting_length(metrics, text, bound, measure, suffix=' ...')
+    if length > 0:
+        return text[0:length] + ' ...'
 
     return text
 
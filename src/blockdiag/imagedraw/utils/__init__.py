@@ -17,7 +17,9 @@ import math
 import unicodedata
 from functools import wraps
 from blockdiag.utils import Size
+from blockdiag.utils.cache import LRUCache
 from blockdiag.utils.compat import u
+from blockdiag.utils.fontmap import FontInfo, parse_fontpath
 
 
 def is_zenkaku(char):
@@ -55,18 +57,31 @@ def textsize(string, font):
     return Size(int(math.ceil(width)), font.size)
 
 
+# measured text sizes; shared between drawers (and renderings) in the process
+textsizes = LRUCache(maxsize=8192)
+
+
+def cachekey(value):
+    if isinstance(value, FontInfo):
+        path, index = parse_fontpath(value.path)
+        return (FontInfo, path, index, value.size)
+    else:
+        return value
+
+
 def cached(fn):
     @wraps(fn)
     def func(self, *args, **kwargs):
-        name = fn.__name__
-        key = args + tuple(kwargs.values())
-
-        if name not in self._method_cache:
-            self._method_cache[name] = {}
+        key = ((self.__class__.__module__, fn.__name__,
+                getattr(self, 'scale_ratio', 1)) +
+               tuple(cachekey(arg) for arg in args) +
+               tuple(sorted(kwargs.items())))
 
-        if key not in self._method_cache[name]:
-            self._method_cache[name][key] = fn(self, *args, **kwargs)
+        value = textsizes.get(key)
+        if value is None:
+            value = fn(self, *args, **kwargs)
+            textsizes.set(key, value)
 
-        return self._method_cache[name][key]
+        return value
 
     return func
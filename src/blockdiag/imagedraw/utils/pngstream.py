@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import zlib
+import struct
+
+
+class PNGStreamWriter(object):
+    """Write PNG image to stream row by row.
+
+    Rows are given as PIL images of same width (bands); they are encoded
+    and written immediately, so whole of the image is never held in memory.
+    """
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    COLOR_TYPES = {'RGB': 2, 'RGBA': 6}
+    IDAT_SIZE = 65536
+
+    def __init__(self, stream, size, mode='RGBA'):
+        if mode not in self.COLOR_TYPES:
+            raise ValueError('unsupported image mode: %s' % mode)
+
+        self.stream = stream
+        self.size = size
+        self.mode = mode
+        self.rows = 0
+        self.compressor = zlib.compressobj()
+        self.pending = []
+        self.pending_size = 0
+
+        self.stream.write(self.SIGNATURE)
+        header = struct.pack('>IIBBBBB', size[0], size[1], 8,
+                             self.COLOR_TYPES[mode], 0, 0, 0)
+        self.write_chunk(b'IHDR', header)
+
+    def write_chunk(self, tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        self.stream.write(struct.pack('>I', len(data)))
+        self.stream.write(tag + data)
+        self.stream.write(struct.pack('>I', crc))
+
+    def write(self, image):
+        if image.mode != self.mode:
+            image = image.convert(self.mode)
+        if image.size[0] != self.size[0]:
+            raise ValueError('width of rows does not match to the image')
+
+        # each row is prefixed with filter type (0: none)
+        data = image.tobytes()
+        rowsize = len(data) // image.size[1]
+        rows = (data[i:i + rowsize] for i in range(0, len(data), rowsize))
+        self.compress(b'\x00' + b'\x00'.join(rows))
+        self.rows += image.size[1]
+
+    def compress(self, data):
+        self.pending.append(self.compressor.compress(data))
+        self.pending_size += len(self.pending[-1])
+        if self.pending_size >= self.IDAT_SIZE:
+            self.flush()
+
+    def flush(self):
+        data = b''.join(self.pending)
+        if data:
+            self.write_chunk(b'IDAT', data)
+
+        self.pending = []
+        self.pending_size = 0
+
+    def close(self):
+        if self.rows != self.size[1]:
+            raise ValueError('%d rows are written; expected %d rows' %
+                             (self.rows, self.size[1]))
+
+        self.pending.append(self.compressor.flush())
+        self.flush()
+        self.write_chunk(b'IEND', b'')
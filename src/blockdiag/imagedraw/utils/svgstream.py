@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+import shutil
+from tempfile import SpooledTemporaryFile
+from blockdiag.imagedraw.simplesvg import g, a, rect, polygon, ellipse, path
+from blockdiag.imagedraw.simplesvg import text, image
+from blockdiag.utils.compat import u
+
+# elements which might take children after they are added to the parent
+CONTAINERS = (g, a)
+
+
+class SVGStreamElement(object):
+    """Proxy of the SVG element which is written to SVGStreamWriter.
+
+    Children added to the proxy are serialized immediately.  The element
+    itself is opened when the first child is written into it.
+    """
+    def __init__(self, writer, element, parent=None):
+        self.writer = writer
+        self.element = element
+        self.parent = parent
+        self.level = parent.level + 1 if parent else 0
+
+    @property
+    def attributes(self):
+        return self.element.attributes
+
+    def addElement(self, element):
+        return self.writer.add(self, element)
+
+
+class SVGStreamWriter(object):
+    """Serialize SVG elements to the spooled stream as soon as added.
+
+    The body of the document is buffered in memory up to *max_size* bytes,
+    and spilled to a temporary file after that.  The root element is
+    written in save(), so its attributes (like width and height) can be
+    changed until the end of drawing.
+    """
+    MAX_SIZE = 1024 * 1024
+
+    def __init__(self, root, max_size=MAX_SIZE):
+        self.root = SVGStreamElement(self, root)
+        self.body = SpooledTemporaryFile(max_size)
+        self.opened = []   # stack of open containers (except the root)
+        self.pending = []  # containers which have no children written yet
+
+    def add(self, parent, element):
+        if isinstance(element, CONTAINERS) and not element.elements:
+            container = SVGStreamElement(self, element, parent)
+            self.pending.append(container)
+            return container
+        else:
+            self.activate(parent)
+            self.flush_pending(parent)
+            self.serialize(element, parent.level + 1)
+            return element
+
+    def activate(self, container):
+        ancestors = []
+        node = container
+        while node is not self.root:
+            ancestors.append(node)
+            node = node.parent
+
+        while self.opened and self.opened[-1] not in ancestors:
+            self.close_tag(self.opened.pop())
+
+        for node in reversed(ancestors):
+            if node not in self.opened:
+                self.flush_pending(node.parent, until=node)
+                self.open_tag(node)
+
+    def flush_pending(self, parent, until=None):
+        """Write empty containers created before the element"""
+        for container in list(self.pending):
+            if container is until:
+                break
+            elif container.parent is parent:
+                self.pending.remove(container)
+                self.serialize(container.element, container.level)
+
+    def open_tag(self, container):
+        if container in self.pending:
+            self.pending.remove(container)
+
+        self.write(container.element.starttag(container.level) + u(">\n"))
+        self.opened.append(container)
+
+    def close_tag(self, container):
+        self.write(container.element.endtag(container.level))
+
+    def serialize(self, element, level):
+        element.to_xml(self, level)
+
+    def write(self, string):
+        self.body.write(string.encode('utf-8'))
+
+    def close(self):
+        """Close all containers; they are reopened on next writing"""
+        self.activate(self.root)
+        self.flush_pending(self.root)
+
+    def save(self, stream):
+        """Write whole of the document to the stream"""
+        self.close()
+
+        root = self.root.element
+        header = root.header() + root.starttag() + u(">\n") + self.head()
+        stream.write(header.encode('utf-8'))
+
+        self.body.seek(0)
+        shutil.copyfileobj(self.body, stream)
+        self.body.seek(0, 2)
+
+        stream.write(root.endtag().encode('utf-8'))
+
+    def head(self):
+        """Return elements written at the head of the document"""
+        return u("")
+
+    def discard(self):
+        self.body.close()
+
+
+class CompactSVGStreamWriter(SVGStreamWriter):
+    """Serialize SVG elements in compact form.
+
+    * presentation attributes are moved to CSS classes (shared by elements
+      having same attributes)
+    * connected paths having same attributes are merged into one path, and
+      collinear segments of them are joined
+    * numbers are rounded to *precision* decimal places
+    """
+    DRAWINGS = (g, rect, polygon, ellipse, path, text, image)
+    STYLES = ('fill', 'stroke', 'stroke-width', 'stroke-dasharray',
+              'font-family', 'font-size', 'font-weight', 'font-style',
+              'style')
+    LENGTHS = ('stroke-width', 'font-size')  # CSS requires units for them
+    NUMBERS = ('x', 'y', 'width', 'height', 'cx', 'cy', 'rx', 'ry',
+               'stroke-width', 'font-size', 'd', 'points', 'transform')
+
+    def __init__(self, root, precision=2, **kwargs):
+        super(CompactSVGStreamWriter, self).__init__(root, **kwargs)
+        self.precision = precision
+        self.classes = {}
+        self.held = None  # (parent, path) which might be merged to next one
+
+    def add(self, parent, element):
+        if self.merge(parent, element):
+            return element
+
+        self.flush_held()
+        fill = element.attributes.get('fill')
+        if isinstance(element, path) and fill == 'none':  # lines and arcs
+            self.held = (parent, element)
+            return element
+        else:
+            return super(CompactSVGStreamWriter, self).add(parent, element)
+
+    def flush_held(self):
+        if self.held:
+            parent, element = self.held
+            self.held = None
+            super(CompactSVGStreamWriter, self).add(parent, element)
+
+    def merge(self, parent, element):
+        if self.held is None or not isinstance(element, path):
+            return False
+
+        _parent, held = self.held
+        if _parent is not parent or styles(held) != styles(element):
+            return False
+
+        commands = held.attributes['d'].path
+        subsequent = element.attributes['d'].path
+        if not subsequent[0].startswith('M'):
+            return False
+        elif not all(re.match('[MLA]', cmd) for cmd in subsequent):
+            return False
+        elif endpoint(commands[-1]) != endpoint(subsequent[0]):
+            return False
+
+        for cmd in subsequent[1:]:
+            if (cmd[0] == 'L' and commands[-1][0] == 'L' and
+                    collinear(endpoint(commands[-2]), endpoint(commands[-1]),
+                              endpoint(cmd))):
+                commands[-1] = cmd
+            else:
+                commands.append(cmd)
+
+        return True
+
+    def serialize(self, element, level):
+        if isinstance(element, self.DRAWINGS):
+            self.compact(element)
+
+        super(CompactSVGStreamWriter, self).serialize(element, level)
+
+    def compact(self, element):
+        attributes = element.attributes
+        for name in self.NUMBERS:
+            if attributes.get(name) is not None:
+                attributes[name] = self.round(attributes[name])
+
+        if attributes.get('d') is not None:
+            attributes['d'] = re.sub(r'\s*([A-Za-z])\s*', r'\1',
+                                     attributes['d'])
+
+        styles = []
+        for name in self.STYLES:
+            value = attributes.pop(name, None)
+            if value is None:
+                continue
+            elif name == 'style':
+                styles.append(value)
+            elif name in self.LENGTHS:
+                styles.append('%s:%spx' % (name, value))
+            else:
+                styles.append('%s:%s' % (name, value))
+
+        if styles:
+            style = ';'.join(styles)
+            if style not in self.classes:
+                self.classes[style] = 's%d' % len(self.classes)
+            attributes['class'] = self.classes[style]
+
+        for child in element.elements:
+            self.compact(child)
+
+    def round(self, value):
+        def _round(matched):
+            number = '%.*f' % (self.precision, float(matched.group(0)))
+            if '.' in number:
+                number = number.rstrip('0').rstrip('.')
+            if number == '-0':
+                number = '0'
+            return number
+
+        if isinstance(value, int):
+            return value
+        else:
+            return re.sub(r'-?\d+\.\d+', _round, str(value))
+
+    def close(self):
+        self.flush_held()
+        super(CompactSVGStreamWriter, self).close()
+
+    def head(self):
+        classes = sorted(self.classes.items(), key=lambda c: int(c[1][1:]))
+        rules = ''.join('.%s{%s}' % (name, style) for style, name in classes)
+        return u('  <style type="text/css">%s</style>\n') % rules
+
+
+def styles(element):
+    """Return attributes of the element except path data"""
+    return dict((key, value) for key, value in element.attributes.items()
+                if key != 'd' and value is not None)
+
+
+def endpoint(command):
+    """Return end point of absolute path command (like 'L 10 20')"""
+    return tuple(float(n) for n in re.findall(r'-?[\d.]+', command)[-2:])
+
+
+def collinear(pt1, pt2, pt3):
+    """Check pt2 lies on the straight line from pt1 to pt3"""
+    dx1, dy1 = pt2[0] - pt1[0], pt2[1] - pt1[1]
+    dx2, dy2 = pt3[0] - pt2[0], pt3[1] - pt2[1]
+    return dx1 * dy2 == dy1 * dx2 and dx1 * dx2 + dy1 * dy2 >= 0
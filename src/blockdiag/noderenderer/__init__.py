@@ -14,15 +14,22 @@
 #  limitations under the License.
 
 from __future__ import division
-import pkg_resources
+import copy
+from blockdiag.imagedraw.filters.shift import ShiftDrawFilter
 from blockdiag.utils import images, Box, XY
+from blockdiag.utils.entrypoints import iter_entry_points
 
 renderers = {}
 searchpath = []
+loaded = set()  # names of loaded entry points (None: all of them)
 
 
-def init_renderers():
-    for plugin in pkg_resources.iter_entry_points('blockdiag_noderenderer'):
+def init_renderers(name=None):
+    if name in loaded or None in loaded:
+        return
+
+    loaded.add(name)
+    for plugin in iter_entry_points('blockdiag_noderenderer', name):
         module = plugin.load()
         if hasattr(module, 'setup'):
             module.setup(module)
@@ -39,15 +46,21 @@ def set_default_namespace(path):
 
 
 def get(shape):
-    if not renderers:
+    names = ["%s.%s" % (path, shape) for path in searchpath] + [shape]
+
+    # load renderers of the shape only; others are loaded if not found
+    for name in names:
+        if name not in renderers:
+            init_renderers(name)
+
+    if not any(name in renderers for name in names):
         init_renderers()
 
-    for path in searchpath:
-        name = "%s.%s" % (path, shape)
+    for name in names:
         if name in renderers:
             return renderers[name]
 
-    return renderers.get(shape)
+    return None
 
 
 class NodeShape(object):
@@ -81,26 +94,36 @@ class NodeShape(object):
 
     def render(self, drawer, _format, **kwargs):
         if self.node.stacked and not kwargs.get('stacked'):
-            node = self.node.duplicate()
-            node.label = ""
-            node.background = ""
-            for i in range(2, 0, -1):
-                # use original_metrics FORCE
-                r = self.metrics.original_metrics.cellsize // 2 * i
-                metrics = self.metrics.shift(r, r)
-
-                self.__class__(node, metrics).render(drawer, _format,
-                                                     stacked=True, **kwargs)
-
-        if hasattr(self, 'render_vector_shape') and _format == 'SVG':
-            self.render_vector_shape(drawer, _format, **kwargs)
-        else:
-            self.render_shape(drawer, _format, **kwargs)
+            self.render_stacked_layers(drawer, _format, **kwargs)
 
+        self.render_outline(drawer, _format, **kwargs)
         self.render_icon(drawer, **kwargs)
         self.render_label(drawer, **kwargs)
         self.render_number_badge(drawer, **kwargs)
 
+    def render_stacked_layers(self, drawer, _format, **kwargs):
+        # draw shapes of stacked layers onto shifted drawers;
+        # geometry of this shape is reused instead of re-calculating metrics
+        layer_node = self.node.duplicate()
+        layer_node.label = ""
+        layer_node.background = ""
+        for i in range(2, 0, -1):
+            r = self.metrics.cellsize // 2 * i
+            layer = ShiftDrawFilter(drawer, r, r)
+            self.render_outline(layer, _format, node=layer_node,
+                                stacked=True, **kwargs)
+
+    def render_outline(self, drawer, _format, node=None, **kwargs):
+        if node is not None and node is not self.node:
+            # render outline of the node through a copy of this shape
+            shape = copy.copy(self)
+            shape.node = node
+            shape.render_outline(drawer, _format, **kwargs)
+        elif hasattr(self, 'render_vector_shape') and _format == 'SVG':
+            self.render_vector_shape(drawer, _format, **kwargs)
+        else:
+            self.render_shape(drawer, _format, **kwargs)
+
     def render_icon(self, drawer, **kwargs):
         if self.node.icon is not None and kwargs.get('shadow') is not True:
             drawer.image(self.iconbox, self.node.icon)
@@ -13,7 +13,7 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from pkg_resources import iter_entry_points
+from blockdiag.utils.entrypoints import iter_entry_points
 
 node_handlers = []
 
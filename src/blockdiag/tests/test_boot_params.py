@@ -8,18 +8,24 @@ else:
 
 import os
 import io
+import json
 import tempfile
-from blockdiag.tests.utils import with_pdf
+from blockdiag.tests.utils import with_pdf, TemporaryDirectory
+from blockdiag.tests.utils import TemporaryFontCache
 
 import blockdiag
-from blockdiag.command import BlockdiagOptions
-from blockdiag.utils.bootstrap import detectfont
+from blockdiag.command import BlockdiagApp, BlockdiagOptions
+from blockdiag.utils.bootstrap import detectfont, search_fontfile
 from blockdiag.utils.compat import u
 
 
 class TestBootParams(unittest.TestCase):
     def setUp(self):
         self.parser = BlockdiagOptions(blockdiag)
+        self.fontcache = TemporaryFontCache()
+
+    def tearDown(self):
+        self.fontcache.clean()
 
     def test_type_option_svg(self):
         options = self.parser.parse(['-Tsvg', 'input.diag'])
@@ -38,11 +44,34 @@ class TestBootParams(unittest.TestCase):
         options = self.parser.parse(['-Tpng', 'input.diag'])
         self.assertEqual(options.output, 'input.png')
 
+    def test_type_option_dzi(self):
+        options = self.parser.parse(['-Tdzi', 'input.diag'])
+        self.assertEqual(options.output, 'input.dzi')
+
     @with_pdf
     def test_type_option_pdf(self):
         options = self.parser.parse(['-Tpdf', 'input.diag'])
         self.assertEqual(options.output, 'input.pdf')
 
+    @with_pdf
+    def test_multiple_type_option(self):
+        options = self.parser.parse(['-Tsvg,png,pdf', 'input.diag'])
+        self.assertEqual(['SVG', 'PNG', 'PDF'], options.types)
+        self.assertEqual(['input.svg', 'input.png', 'input.pdf'],
+                         options.outputs)
+
+        options = self.parser.parse(['-Tsvg,png', '-o', 'out.svg',
+                                     'input.diag'])
+        self.assertEqual(['out.svg', 'out.png'], options.outputs)
+
+        options = self.parser.parse(['-Tsvg,png', '-o', 'a.svg,b.png',
+                                     'input.diag'])
+        self.assertEqual(['a.svg', 'b.png'], options.outputs)
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['-Tsvg,png', '-o', 'a.svg,b.png,c.pdf',
+                               'input.diag'])
+
     def test_invalid_type_option(self):
         with self.assertRaises(RuntimeError):
             self.parser.parse(['-Tsvgz', 'input.diag'])
@@ -68,6 +97,127 @@ class TestBootParams(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             self.parser.parse(['-Tpdf', '--nodoctype', 'input.diag'])
 
+    def test_compact_option(self):
+        self.parser.parse(['-Tsvg', '--compact', '--precision=1',
+                           'input.diag'])
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['-Tpng', '--compact', 'input.diag'])
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['-Tsvg', '--precision=1', 'input.diag'])
+
+    def test_cache_options(self):
+        options = self.parser.parse(['--cache-dir', '/tmp', '--offline',
+                                     'input.diag'])
+        self.assertEqual('/tmp', options.cache_dir)
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['--offline', 'input.diag'])
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['--cache-ttl=-1', 'input.diag'])
+
+    def test_multipage_option(self):
+        options = self.parser.parse(['-Tpdf', '--multipage', 'a.diag',
+                                     'b.diag'])
+        self.assertEqual(['a.diag', 'b.diag'], options.inputs)
+        self.assertEqual('a.pdf', options.output)
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['-Tsvg', '--multipage', 'a.diag', 'b.diag'])
+
+    def test_batch_option(self):
+        try:
+            tmpdir = TemporaryDirectory()
+            for name in ('a.diag', 'b.diag', 'c.txt'):
+                open(os.path.join(tmpdir.name, name), 'w').close()
+
+            pattern = os.path.join(tmpdir.name, '*.diag')
+            options = self.parser.parse(['--batch', '-j', '2', '-o', 'out',
+                                         pattern, 'x.diag'])
+            self.assertEqual([os.path.join(tmpdir.name, 'a.diag'),
+                              os.path.join(tmpdir.name, 'b.diag'),
+                              'x.diag'], options.inputs)
+            self.assertEqual('out', options.outdir)
+
+            manifest = os.path.join(tmpdir.name, 'c.txt')
+            with open(manifest, 'w') as fd:
+                fd.write("# comment\na.diag\n\nb.diag\n")
+            options = self.parser.parse(['--manifest', manifest])
+            self.assertTrue(options.batch)
+            self.assertEqual([os.path.join(tmpdir.name, 'a.diag'),
+                              os.path.join(tmpdir.name, 'b.diag')],
+                             options.inputs)
+
+            with self.assertRaises(RuntimeError):
+                self.parser.parse(['--batch', pattern + '.unknown'])
+
+            with self.assertRaises(RuntimeError):
+                self.parser.parse(['-j', '2', 'input.diag'])
+
+            with self.assertRaises(RuntimeError):
+                self.parser.parse(['--batch', '-j', '0', 'input.diag'])
+        finally:
+            tmpdir.clean()
+
+    def test_batch_mode(self):
+        try:
+            tmpdir = TemporaryDirectory()
+            inputs = []
+            for name, source in (('a', 'A -> B'), ('b', 'A ->'),
+                                 ('c', 'C')):
+                inputs.append(os.path.join(tmpdir.name, name + '.diag'))
+                with open(inputs[-1], 'w') as fd:
+                    fd.write("blockdiag { %s }" % source)
+
+            outdir = os.path.join(tmpdir.name, 'out')
+            args = ['-Tsvg', '--batch', '-j', '2', '-o', outdir] + inputs
+            stderr = sys.stderr
+            sys.stderr = io.StringIO()
+            try:
+                self.assertEqual(-1, BlockdiagApp().run(args))
+                errors = sys.stderr.getvalue()
+            finally:
+                sys.stderr = stderr
+
+            # errors are reported per file; others are rendered
+            self.assertEqual(['a.svg', 'c.svg'], sorted(os.listdir(outdir)))
+            self.assertEqual(1, errors.count('ERROR'))
+            self.assertIn(inputs[1], errors)
+        finally:
+            tmpdir.clean()
+
+    def test_batch_mode_dzi(self):
+        try:
+            tmpdir = TemporaryDirectory()
+            inputs = []
+            for name in ('a', 'b'):
+                inputs.append(os.path.join(tmpdir.name, name + '.diag'))
+                with open(inputs[-1], 'w') as fd:
+                    fd.write("blockdiag { A -> B }")
+
+            # tiles are rendered in each worker (daemonic) process
+            args = ['-Tdzi', '--batch', '-j', '2'] + inputs
+            self.assertEqual(0, BlockdiagApp().run(args))
+            for name in ('a', 'b'):
+                path = os.path.join(tmpdir.name, name)
+                self.assertTrue(os.path.isfile(path + '.dzi'))
+                self.assertEqual(['0_0.png'],
+                                 os.listdir(os.path.join(path + '_files',
+                                                         '0')))
+        finally:
+            tmpdir.clean()
+
+    def test_shadow_compositing_option(self):
+        options = self.parser.parse(['--shadow-compositing=layer',
+                                     'input.diag'])
+        self.assertEqual('layer', options.shadow_compositing)
+
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['-Tsvg', '--shadow-compositing=layer',
+                               'input.diag'])
+
     def test_svg_notransparency_option(self):
         with self.assertRaises(RuntimeError):
             self.parser.parse(['-Tsvg', '--no-transparency', 'input.diag'])
@@ -79,6 +229,20 @@ class TestBootParams(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             self.parser.parse(['-Tpdf', '--no-transparency', 'input.diag'])
 
+    def test_antialias_mode_option(self):
+        options = self.parser.parse(['-a', 'input.diag'])
+        self.assertEqual(options.antialias_mode, 'supersample')
+        self.assertEqual(options.supersampling, 2)
+
+        options = self.parser.parse(['-a', '--antialias-mode=primitive',
+                                     '--supersampling=4', 'input.diag'])
+        self.assertEqual(options.antialias_mode, 'primitive')
+        self.assertEqual(options.supersampling, 4)
+
+    def test_invalid_supersampling_option(self):
+        with self.assertRaises(RuntimeError):
+            self.parser.parse(['-a', '--supersampling=1', 'input.diag'])
+
     def test_config_option(self):
         try:
             tmp = tempfile.mkstemp()
@@ -184,3 +348,39 @@ class TestBootParams(unittest.TestCase):
 
         with self.assertRaises(RuntimeError):
             DiagramDraw('unknown', Diagram())
+
+
+class TestSearchFontfile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.fontdir = os.path.join(self.tmpdir.name, 'fonts')
+        self.cachepath = os.path.join(self.tmpdir.name, 'cache', 'fonts.json')
+        os.makedirs(os.path.join(self.fontdir, 'truetype'))
+
+    def tearDown(self):
+        self.tmpdir.clean()
+
+    def search(self):
+        return search_fontfile([self.fontdir], ['font.ttf'], self.cachepath)
+
+    def test_search_fontfile(self):
+        self.assertIsNone(self.search())
+        self.assertTrue(os.path.exists(self.cachepath))
+
+        # cache is invalidated by adding fonts
+        fontpath = os.path.join(self.fontdir, 'truetype', 'font.ttf')
+        open(fontpath, 'w').close()
+        os.utime(os.path.dirname(fontpath), (0, 0))
+        self.assertEqual(fontpath, self.search())
+
+        # cached result is used while directories are not modified
+        with open(self.cachepath) as fd:
+            cache = json.load(fd)
+        cache['fontpath'] = self.cachepath
+        with open(self.cachepath, 'w') as fd:
+            json.dump(cache, fd)
+        self.assertEqual(self.cachepath, self.search())
+
+        # cache is invalidated by removing fonts
+        os.remove(fontpath)
+        self.assertIsNone(self.search())
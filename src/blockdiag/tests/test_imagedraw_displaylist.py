@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from io import BytesIO
+from blockdiag.builder import ScreenNodeBuilder
+from blockdiag.drawer import DiagramDraw
+from blockdiag.imagedraw import displaylist
+from blockdiag.parser import parse_string
+from blockdiag.tests.utils import with_pdf, TemporaryDirectory
+from blockdiag.utils import Box, XY
+
+
+class TestDisplayList(unittest.TestCase):
+    code = ("blockdiag { A -> B -> C; B -> D; B [shape = cloud]; "
+            "A [href = 'http://example.com/']; group { C; D; } }")
+
+    def build(self):
+        return ScreenNodeBuilder.build(parse_string(self.code))
+
+    def test_replay_svg(self):
+        diagram = self.build()
+        draw = DiagramDraw('SVG', diagram, code=self.code)
+        draw.draw()
+        expected = draw.save()
+
+        draw = DiagramDraw('DISPLAYLIST', diagram, code=self.code)
+        draw.draw()
+        recorded = draw.save()
+        self.assertEqual(expected, recorded.render('SVG', None,
+                                                   code=self.code))
+
+    def test_dump_and_load(self):
+        draw = DiagramDraw('DISPLAYLIST', self.build())
+        draw.draw()
+        recorded = draw.save()
+
+        stream = BytesIO()
+        recorded.dump(stream)
+        stream.seek(0)
+        loaded = displaylist.load(stream)
+
+        self.assertEqual(recorded.pagesize, loaded.pagesize)
+        self.assertEqual(len(recorded.operations), len(loaded.operations))
+        self.assertEqual(recorded.render('SVG', None),
+                         loaded.render('SVG', None))
+
+    @with_pdf
+    def test_render_pages(self):
+        displaylists = []
+        for size in ((200, 100), (300, 150), (120, 400)):
+            recorded = displaylist.DisplayList()
+            recorded.set_canvas_size(size)
+            recorded.line([XY(10, 10), XY(50, 50)], fill='black')
+            recorded.rectangle(Box(5, 5, 40, 40), fill='red')
+            displaylists.append(recorded)
+
+        try:
+            tmpdir = TemporaryDirectory()
+            filename = os.path.join(tmpdir.name, 'output.pdf')
+            displaylist.render_pages(displaylists, 'PDF', filename)
+            with open(filename, 'rb') as fd:
+                document = fd.read()
+        finally:
+            tmpdir.clean()
+
+        pages = re.findall(b'/Type /Page\\b(?!s)', document)
+        self.assertEqual(3, len(pages))
+        mediaboxes = re.findall(b'/MediaBox \\[ *0 0 (\\d+) (\\d+) *\\]',
+                                document)
+        self.assertEqual([(b'200', b'100'), (b'300', b'150'),
+                          (b'120', b'400')], mediaboxes)
+
+        with self.assertRaises(RuntimeError):
+            displaylist.render_pages(displaylists, 'SVG', filename)
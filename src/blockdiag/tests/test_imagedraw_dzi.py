@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import blockdiag.builder
+import blockdiag.drawer
+import blockdiag.parser
+from blockdiag.tests.utils import TemporaryDirectory
+from PIL import Image
+
+
+class TestDeepZoomImageDraw(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.clean()
+
+    def test_render(self):
+        tree = blockdiag.parser.parse_string('{ A -> B -> C; B -> D; }')
+        diagram = blockdiag.builder.ScreenNodeBuilder.build(tree)
+        filename = os.path.join(self.tmpdir.name, 'output.dzi')
+        drawer = blockdiag.drawer.DiagramDraw('DZI', diagram, filename,
+                                              tilesize=64, processes=1)
+        drawer.draw()
+        drawer.save()
+
+        with open(filename) as fd:
+            descriptor = fd.read()
+        self.assertIn('TileSize="64"', descriptor)
+        matched = re.search(r'Width="(\d+)" Height="(\d+)"', descriptor)
+        width, height = [int(n) for n in matched.groups()]
+        self.assertEqual((640, 200), (width, height))
+
+        # levels: 0 (1x1) .. 10 (640x200); 2 ** 10 >= 640
+        tiledir = os.path.join(self.tmpdir.name, 'output_files')
+        self.assertEqual([str(i) for i in range(11)],
+                         sorted(os.listdir(tiledir), key=int))
+        self.assertEqual(['0_0.png'], os.listdir(os.path.join(tiledir, '0')))
+        self.assertEqual((1, 1),
+                         Image.open(os.path.join(tiledir, '0',
+                                                 '0_0.png')).size)
+
+        # largest level: 10 x 4 tiles; tiles of last row are clipped
+        tiles = os.listdir(os.path.join(tiledir, '10'))
+        self.assertEqual(10 * 4, len(tiles))
+        for col, row, size in ((0, 0, (64, 64)), (9, 0, (64, 64)),
+                               (0, 3, (64, 8)), (9, 3, (64, 8))):
+            tile = '%d_%d.png' % (col, row)
+            self.assertEqual(size, Image.open(os.path.join(tiledir, '10',
+                                                           tile)).size)
+
+        # next level is reduced by half: 320x100
+        tiles = os.listdir(os.path.join(tiledir, '9'))
+        self.assertEqual(5 * 2, len(tiles))
+        self.assertEqual((64, 36), Image.open(os.path.join(tiledir, '9',
+                                                           '4_1.png')).size)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import blockdiag.builder
+import blockdiag.drawer
+import blockdiag.parser
+from blockdiag.imagedraw.filters.shift import ShiftDrawFilter
+from blockdiag.imagedraw.simplesvg import pathdata
+from blockdiag.imagedraw.svg import SVGImageDraw
+from blockdiag.utils import Box, XY
+
+
+class RecordingDrawer(object):
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return record
+
+
+class TestShiftDrawFilter(unittest.TestCase):
+    def test_offsets(self):
+        target = RecordingDrawer()
+        drawer = ShiftDrawFilter(target, 8, 4)
+        drawer.line([XY(0, 0), (10, 10)], fill='black')
+        drawer.rectangle(Box(0, 0, 10, 10))
+        drawer.polygon([[XY(0, 0), XY(10, 0)], [XY(0, 10)]])
+        drawer.arc(Box(0, 0, 10, 10), 0, 90)
+        drawer.text(XY(1, 2), 'text', None)
+        drawer.path('pathdata')
+
+        self.assertEqual([
+            ('line', ([XY(8, 4), XY(18, 14)],), {'fill': 'black'}),
+            ('rectangle', (Box(8, 4, 18, 14),), {}),
+            ('polygon', ([[XY(8, 4), XY(18, 4)], [XY(8, 14)]],), {}),
+            ('arc', (Box(8, 4, 18, 14), 0, 90), {}),
+            ('text', (XY(9, 6), 'text', None), {}),
+            ('path', ('pathdata',), {'shift': XY(8, 4)}),
+        ], target.calls)
+
+    def test_svg_path(self):
+        drawer = SVGImageDraw(None)
+        drawer.set_canvas_size((100, 100))
+        ShiftDrawFilter(drawer, 8, 4).path(pathdata(0, 0), fill='none')
+
+        image = drawer.save(None, None, 'SVG')
+        self.assertIn('transform="translate(8,4)"', image)
+
+    def test_stacked_node(self):
+        tree = blockdiag.parser.parse_string('{ A [stacked]; }')
+        diagram = blockdiag.builder.ScreenNodeBuilder.build(tree)
+        node = diagram.nodes[0]
+        drawer = blockdiag.drawer.DiagramDraw('SVG', diagram)
+        drawer.draw()
+        image = drawer.save()
+
+        # two layers and the node itself; label is drawn once
+        self.assertEqual(3, image.count('<rect fill="rgb(255,255,255)"'))
+        self.assertEqual(1, image.count('>A</text>'))
+        self.assertEqual('A', node.label)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from blockdiag.tests.utils import with_pdf, truetype_fontpath
+from blockdiag.tests.utils import TemporaryDirectory
+from blockdiag.utils import Box, Size
+from blockdiag.utils.fontmap import FontInfo
+
+
+@unittest.skipIf(truetype_fontpath() is None, 'TrueType font not found')
+class TestPDFImageDraw(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'output.pdf')
+        self.font = FontInfo('sansserif', truetype_fontpath(), 11)
+
+    def tearDown(self):
+        self.tmpdir.clean()
+
+    @with_pdf
+    def test_register_font_once(self):
+        from reportlab.pdfbase import pdfmetrics
+        from blockdiag.imagedraw.pdf import PDFImageDraw
+
+        PDFImageDraw(self.filename).textsize('Hello', self.font)
+        ttfont = pdfmetrics.getFont(self.font.path)
+
+        # fonts are registered to reportlab once in the process
+        PDFImageDraw(self.filename).textsize('World', self.font)
+        self.assertIs(ttfont, pdfmetrics.getFont(self.font.path))
+
+    @with_pdf
+    def test_create_canvas_lazily(self):
+        from blockdiag.imagedraw.pdf import PDFImageDraw
+
+        # measuring texts does not create canvas
+        drawer = PDFImageDraw(self.filename)
+        self.assertTrue(drawer.textsize('Hello', self.font).width > 0)
+        self.assertIsNone(drawer._canvas)
+
+        # canvas is created with the final page size on drawing
+        drawer.set_canvas_size(Size(200, 100))
+        self.assertIsNone(drawer._canvas)
+        drawer.rectangle(Box(10, 10, 50, 50), fill='red')
+        drawer.text((10, 80), 'Hello', self.font, fill='black')
+        drawer.save(None, None, 'PDF')
+
+        with open(self.filename, 'rb') as fd:
+            document = fd.read()
+        mediaboxes = re.findall(b'/MediaBox \\[ *0 0 (\\d+) (\\d+) *\\]',
+                                document)
+        self.assertEqual([(b'200', b'100')], mediaboxes)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import blockdiag.builder
+import blockdiag.drawer
+import blockdiag.parser
+from io import BytesIO
+from blockdiag.imagedraw import png
+from blockdiag.tests.utils import ImageServer, TemporaryDirectory
+from blockdiag.tests.utils import truetype_fontpath
+from blockdiag.utils import urlcache, Size
+from blockdiag.utils.fontmap import FontInfo
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+
+class PNGTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.clean()
+
+    def render(self, source, **kwargs):
+        tree = blockdiag.parser.parse_string(source)
+        diagram = blockdiag.builder.ScreenNodeBuilder.build(tree)
+        filename = os.path.join(self.tmpdir.name, 'output.png')
+        drawer = blockdiag.drawer.DiagramDraw('PNG', diagram, filename,
+                                              **kwargs)
+        drawer.draw()
+        drawer.save()
+
+        return Image.open(filename).convert('RGB')
+
+
+@unittest.skipIf(truetype_fontpath() is None, 'TrueType font not found')
+class TestPNGFonts(unittest.TestCase):
+    def setUp(self):
+        png.ttfonts.clear()
+
+    def test_ttfont_cache(self):
+        font = FontInfo('sansserif', truetype_fontpath(), 11)
+        png.ImageDrawEx(None).textsize('Hello', font)
+        png.ImageDrawEx(None).textsize('World', font)
+
+        # fonts are loaded once and shared between drawers
+        self.assertEqual(1, len(png.ttfonts))
+        self.assertEqual(1, png.ttfonts.misses)
+        self.assertIs(png.ttfont_for(font), png.ttfont_for(font))
+
+        font = FontInfo('sansserif', truetype_fontpath(), 20)
+        png.ImageDrawEx(None).textsize('Hello', font)
+        self.assertEqual(2, len(png.ttfonts))
+
+
+class TestPNGText(unittest.TestCase):
+    def drawer(self, **kwargs):
+        drawer = png.ImageDrawEx(None, color=(255, 255, 255), **kwargs)
+        drawer.set_canvas_size(Size(120, 40))
+        return drawer
+
+    @unittest.skipIf(truetype_fontpath() is None, 'TrueType font not found')
+    def test_glyphs(self):
+        font = FontInfo('sansserif', truetype_fontpath(), 11)
+        drawer = self.drawer()
+        drawer.text((5, 5), 'Hello', font, fill=(255, 0, 0))
+
+        # same as pasting a filler through 1-bit mask of the text
+        ttfont = png.ttfont_for(font)
+        mask = Image.new('1', drawer.textsize('Hello', font))
+        ImageDraw.Draw(mask).text((0, 0), 'Hello', fill='white', font=ttfont)
+        expected = Image.new('RGB', (120, 40), (255, 255, 255))
+        expected.paste(Image.new('RGB', mask.size, (255, 0, 0)), (5, 5), mask)
+
+        self.assertIsNone(ImageChops.difference(expected,
+                                                drawer._image).getbbox())
+        self.assertEqual(2, len(drawer._image.getcolors()))  # not antialiased
+
+    def test_scaled_text_images(self):
+        png.text_images.clear()
+        font = FontInfo('sansserif', None, 11)
+        drawer = self.drawer(scale_ratio=2)
+        drawer.text((5, 5), 'A', font, fill=(0, 0, 0))
+        drawer.text((25, 5), 'A', font, fill=(0, 0, 0))
+        drawer.text((45, 5), 'B', font, fill=(0, 0, 0))
+
+        # texts are rendered and resized once for each color and scale
+        self.assertEqual(2, len(png.text_images))
+        self.assertEqual(1, png.text_images.hits)
+
+        key = ('A', (0, 0, 0), 2)
+        self.assertIs(png.text_images.get(key),
+                      drawer.scaled_text_image('A', (0, 0, 0)))
+
+
+class TestPNGShadows(PNGTestCase):
+    def test_shadow_sprites(self):
+        png.shadow_sprites.clear()
+        self.render('{ A -> B -> C; }')
+
+        # shadows of same shapes are blurred once
+        self.assertEqual(1, len(png.shadow_sprites))
+        self.assertEqual(1, png.shadow_sprites.misses)
+        self.assertEqual(2, png.shadow_sprites.hits)
+
+    def test_shadow_layer(self):
+        source = '{ A -> B -> C; A -> D; }'
+        shape = self.render(source, shadow_compositing='shape')
+        layer = self.render(source, shadow_compositing='layer')
+
+        diff = ImageChops.difference(shape, layer)
+        self.assertLessEqual(max(band[1] for band in diff.getextrema()), 8)
+        self.assertLess(max(ImageStat.Stat(diff).mean), 0.5)
+
+
+class TestPNGIcons(PNGTestCase):
+    def setUp(self):
+        super(TestPNGIcons, self).setUp()
+        png.icon_images.clear()
+
+    def tearDown(self):
+        super(TestPNGIcons, self).tearDown()
+        urlcache.configure()
+
+    def icon(self, color):
+        stream = BytesIO()
+        Image.new('RGB', (16, 16), color).save(stream, 'PNG')
+        return stream.getvalue()
+
+    def render_icons(self, url):
+        source = '{ A [icon="%s"]; B [icon="%s"]; C [icon="%s"]; }'
+        image = self.render(source % (url, url, url))
+        return set(color for _, color in image.getcolors())
+
+    def test_shared_icon(self):
+        path = os.path.join(self.tmpdir.name, 'icon.png')
+        with open(path, 'wb') as fd:
+            fd.write(self.icon('red'))
+
+        # an icon shared by nodes is decoded once
+        self.assertIn((255, 0, 0), self.render_icons(path))
+        self.assertEqual(1, len(png.icon_images))
+        self.assertEqual(1, png.icon_images.misses)
+        self.assertEqual(2, png.icon_images.hits)
+
+        # modified icon is loaded again
+        with open(path, 'wb') as fd:
+            fd.write(self.icon('blue'))
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+        colors = self.render_icons(path)
+        self.assertIn((0, 0, 255), colors)
+        self.assertNotIn((255, 0, 0), colors)
+        self.assertEqual(2, png.icon_images.misses)
+
+    def test_remote_icon(self):
+        server = ImageServer(self.icon('red'), '"v1"')
+        try:
+            urlcache.configure(ttl=0)
+            self.assertIn((255, 0, 0), self.render_icons(server.url()))
+            self.assertEqual(1, png.icon_images.misses)
+
+            # modified icon is loaded again after revalidation
+            server.update(self.icon('blue'), '"v2"')
+            colors = self.render_icons(server.url())
+            self.assertIn((0, 0, 255), colors)
+            self.assertNotIn((255, 0, 0), colors)
+            self.assertEqual(2, png.icon_images.misses)
+        finally:
+            server.stop()
+
+
+class TestTiledImageDrawEx(PNGTestCase):
+    diagrams = ['node_shape.diag', 'node_attribute.diag',
+                'group_children_order.diag', 'nested_groups.diag']
+
+    def test_same_as_whole_page(self):
+        basedir = os.path.join(os.path.dirname(__file__), 'diagrams')
+        for name in self.diagrams:
+            with open(os.path.join(basedir, name)) as fd:
+                source = fd.read()
+
+            expected = self.render(source)
+            image = self.render(source, tiled=True, tile_height=64)
+            self.assertEqual(expected.size, image.size)
+            self.assertIsNone(ImageChops.difference(expected, image).getbbox(),
+                              name)
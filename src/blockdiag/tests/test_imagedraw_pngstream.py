@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from io import BytesIO
+from PIL import Image, ImageChops
+from blockdiag.imagedraw.utils.pngstream import PNGStreamWriter
+
+
+class TestPNGStreamWriter(unittest.TestCase):
+    def test_write_bands(self):
+        image = Image.new('RGBA', (30, 20), (255, 255, 255, 0))
+        image.paste((255, 0, 0, 255), (5, 5, 25, 15))
+
+        stream = BytesIO()
+        writer = PNGStreamWriter(stream, image.size, 'RGBA')
+        for top in range(0, 20, 7):
+            band = image.crop((0, top, 30, min(20, top + 7)))
+            writer.write(band)
+        writer.close()
+
+        stream.seek(0)
+        written = Image.open(stream)
+        self.assertEqual((30, 20), written.size)
+        self.assertEqual('RGBA', written.mode)
+        self.assertIsNone(ImageChops.difference(image, written).getbbox())
+
+    def test_insufficient_rows(self):
+        writer = PNGStreamWriter(BytesIO(), (30, 20), 'RGB')
+        writer.write(Image.new('RGB', (30, 10)))
+        with self.assertRaises(ValueError):
+            writer.close()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from blockdiag.imagedraw.svg import SVGImageDraw
+from blockdiag.tests.utils import TemporaryDirectory
+from blockdiag.utils import Box
+
+
+class TestSVGImageDraw(unittest.TestCase):
+    path = os.path.join(os.path.dirname(__file__), 'diagrams', 'white.gif')
+
+    def draw_images(self, **kwargs):
+        drawer = SVGImageDraw(None, **kwargs)
+        drawer.set_canvas_size((100, 100))
+        drawer.image(Box(0, 0, 40, 20), self.path)
+        anchor = drawer.anchor('http://example.com/')
+        anchor.image(Box(50, 50, 90, 70), self.path)
+        return drawer.save(None, None, 'SVG')
+
+    def test_embedded_images(self):
+        image = self.draw_images()
+        self.assertEqual(1, image.count('<symbol id="image0"'))
+        self.assertEqual(1, image.count('data:;base64,R0lGOD'))
+        self.assertEqual(2, image.count('xlink:href="#image0"'))
+
+    def test_external_images(self):
+        image = self.draw_images(external_images=True)
+        self.assertNotIn('<symbol', image)
+        self.assertEqual(2, image.count('xlink:href="%s"' % self.path))
+
+    def test_unknown_image_size(self):
+        try:
+            tmpdir = TemporaryDirectory()
+            fd, path = tmpdir.mkstemp()
+            os.write(fd, b'unknown image format')
+            os.close(fd)
+
+            drawer = SVGImageDraw(None)
+            drawer.set_canvas_size((100, 100))
+            drawer.image(Box(0, 0, 40, 20), path)
+            drawer.image(Box(50, 50, 90, 70), path)
+            image = drawer.save(None, None, 'SVG')
+
+            # embedded to each box as before
+            self.assertNotIn('<symbol', image)
+            self.assertEqual(2, image.count('data:;base64,dW5rbm93'))
+            self.assertIn('<image height="20" width="40" x="50"', image)
+        finally:
+            tmpdir.clean()
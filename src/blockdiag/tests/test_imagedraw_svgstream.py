@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from io import BytesIO
+from blockdiag.imagedraw.simplesvg import svg, g, a, rect, path, pathdata
+from blockdiag.imagedraw.utils.svgstream import (
+    SVGStreamWriter, CompactSVGStreamWriter
+)
+
+
+def line(*points):
+    pd = pathdata(*points[0])
+    for point in points[1:]:
+        pd.line(*point)
+    return pd
+
+
+class TestSVGStreamWriter(unittest.TestCase):
+    def build(self, root):
+        anchor = a('http://example.com/')
+        anchor.addElement(rect(0, 0, 10, 10))
+        root.addElement(anchor)
+        root.addElement(g())
+        group = g(id='group')
+        group.addElement(rect(10, 10, 10, 10))
+        root.addElement(group)
+        root.addElement(rect(20, 20, 10, 10))
+
+    def test_same_as_tree(self):
+        tree = svg(0, 0, 100, 100)
+        self.build(tree)
+
+        writer = SVGStreamWriter(svg(0, 0, 100, 100))
+        self.build(writer.root)
+        stream = BytesIO()
+        writer.save(stream)
+
+        self.assertEqual(tree.to_xml(), stream.getvalue().decode('utf-8'))
+
+    def test_containers_written_later(self):
+        writer = SVGStreamWriter(svg(0, 0, 100, 100), max_size=0)
+        anchor = writer.root.addElement(a('http://example.com/'))
+        group = writer.root.addElement(g())
+        writer.root.addElement(rect(0, 0, 10, 10))  # group is empty
+        anchor.addElement(rect(10, 10, 10, 10))
+        writer.root.attributes['width'] = 200
+
+        stream = BytesIO()
+        writer.save(stream)
+        expected = svg(0, 0, 100, 100)
+        expected.attributes['width'] = 200
+        expected.addElement(a('http://example.com/'))
+        expected.addElement(g())
+        expected.addElement(rect(0, 0, 10, 10))
+        expected.addElement(a('http://example.com/'))
+        expected.elements[-1].addElement(rect(10, 10, 10, 10))
+        self.assertEqual(expected.to_xml(), stream.getvalue().decode('utf-8'))
+
+        # save again after drawing more
+        group.addElement(rect(20, 20, 10, 10))
+        stream = BytesIO()
+        writer.save(stream)
+        self.assertIn(b'<rect height="10" width="10" x="20" y="20" />',
+                      stream.getvalue())
+
+
+class TestCompactSVGStreamWriter(unittest.TestCase):
+    def test_compact(self):
+        writer = CompactSVGStreamWriter(svg(0, 0, 100, 100), precision=1)
+        root = writer.root
+        root.addElement(rect(0.25, 0, 10, 10, fill='red', stroke_width=None))
+        root.addElement(path(line((0, 0), (10, 0)), fill='none'))
+        root.addElement(path(line((10, 0), (20, 0)), fill='none'))
+        root.addElement(path(line((20, 0), (20, 10)), fill='none'))
+        root.addElement(path(line((0, 5), (5, 5)), fill='white'))
+        root.addElement(rect(10, 10.04, 10, 10, fill='red'))
+
+        stream = BytesIO()
+        writer.save(stream)
+        image = stream.getvalue().decode('utf-8')
+        self.assertIn('<style type="text/css">.s0{fill:red}.s1{fill:none}'
+                      '.s2{fill:white}</style>', image)
+        self.assertIn('<rect class="s0" height="10" width="10" x="0.2" '
+                      'y="0" />', image)
+        self.assertIn('<path class="s1" d="M0 0L20 0L20 10" />', image)
+        self.assertIn('<path class="s2" d="M0 5L5 5" />', image)
+        self.assertIn('<rect class="s0" height="10" width="10" x="10" '
+                      'y="10" />', image)
@@ -6,11 +6,14 @@ if sys.version_info < (2, 7):
 else:
     import unittest
 
+from string import ascii_lowercase
+from blockdiag.imagedraw.base import ImageDraw
 from blockdiag.imagedraw.textfolder import splitlabel
 from blockdiag.imagedraw.textfolder import splittext
 from blockdiag.imagedraw.textfolder import truncate_text
-from blockdiag.utils import Size
+from blockdiag.utils import Box, Size
 from blockdiag.utils.compat import u
+from blockdiag.utils.fontmap import FontInfo
 
 
 CHAR_WIDTH = 14
@@ -87,6 +90,21 @@ class TestTextFolder(unittest.TestCase):
         ret = splittext(metrics, text, CHAR_WIDTH * 3)
         self.assertEqual([' '], ret)
 
+        # text should be folded at word boundaries
+        text = "abc de fghi jk"
+        ret = splittext(metrics, text, CHAR_WIDTH * 6)
+        self.assertEqual(['abc de', 'fghi', 'jk'], ret)
+
+        # too long word should be folded in the middle
+        text = "abcdefgh ij"
+        ret = splittext(metrics, text, CHAR_WIDTH * 3)
+        self.assertEqual(['abc', 'def', 'gh', 'ij'], ret)
+
+        # too narrow to render any character
+        text = "abc"
+        ret = splittext(metrics, text, CHAR_WIDTH - 1)
+        self.assertEqual([], ret)
+
     def test_truncate_text(self):
         metrics = Metrics()
 
@@ -104,3 +122,46 @@ class TestTextFolder(unittest.TestCase):
         text = "abcdef"
         ret = truncate_text(metrics, text, CHAR_WIDTH * 4)
         self.assertEqual("abcdef", ret)
+
+
+class FixedWidthImageDraw(ImageDraw):
+    def textlinesize(self, string, font, **kwargs):
+        return Size(len(string) * font.size, font.size)
+
+
+class TestFitFontsize(unittest.TestCase):
+    def setUp(self):
+        self.drawer = FixedWidthImageDraw()
+        self.font = FontInfo('sansserif', None, 10)
+
+    def fit(self, width, height, string):
+        box = Box(0, 0, width, height)
+        return self.drawer.fit_fontsize(box, string, self.font)
+
+    def test_fit_fontsize(self):
+        # fits at full size
+        self.assertEqual(10, self.fit(100, 40, 'abc'))
+
+        # needs shrunk size (0.8 times on each step)
+        self.assertEqual(8, self.fit(100, 12, ascii_lowercase))
+
+        # never fits
+        self.assertEqual(0, self.fit(100, 1, 'abc'))
+
+    def test_fit_fontsize_equals_to_linear_search(self):
+        def linear_search(height):
+            fontsize = self.font.size
+            while fontsize > 0:
+                font = self.font.duplicate()
+                font.size = fontsize
+                box = Box(0, 0, 100, height)
+                lines = self.drawer.textfolder(box, ascii_lowercase, font)
+                if any(True for _ in lines.lines):
+                    return fontsize
+                fontsize = int(fontsize * 0.8)
+
+            return 0
+
+        for height in range(0, 20):
+            self.assertEqual(linear_search(height),
+                             self.fit(100, height, ascii_lowercase))
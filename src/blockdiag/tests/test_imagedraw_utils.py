@@ -8,9 +8,10 @@ else:
 
 from blockdiag.imagedraw.utils import (
     is_zenkaku, zenkaku_len, hankaku_len,
-    string_width, textsize
+    string_width, textsize, cached, textsizes
 )
 from blockdiag.utils.compat import u
+from blockdiag.utils.fontmap import FontInfo
 
 
 class TestUtils(unittest.TestCase):
@@ -62,3 +63,28 @@ class TestUtils(unittest.TestCase):
         # あいう
         font = FontInfo('serif', None, 18)
         self.assertEqual((54, 18), textsize(u("\u3042\u3044\u3046"), font))
+
+    def test_cached(self):
+        class Drawer(object):
+            called = 0
+
+            @cached
+            def textlinesize(self, string, font):
+                Drawer.called += 1
+                return textsize(string, font)
+
+        textsizes.clear()
+        font = FontInfo('serif', None, 11)
+        self.assertEqual((19, 11), Drawer().textlinesize(u("abc"), font))
+
+        # results are shared between drawers and copies of fonts
+        self.assertEqual((19, 11),
+                         Drawer().textlinesize(u("abc"), font.duplicate()))
+        self.assertEqual(1, Drawer.called)
+        self.assertEqual(1, textsizes.hits)
+        self.assertEqual(1, textsizes.misses)
+
+        # font size is a part of cache key
+        font.size = 24
+        self.assertEqual((40, 24), Drawer().textlinesize(u("abc"), font))
+        self.assertEqual(2, Drawer.called)
@@ -10,6 +10,7 @@ import os
 import io
 from blockdiag.utils.compat import u
 from blockdiag.tests.utils import capture_stderr, with_pil, TemporaryDirectory
+from blockdiag.tests.utils import TemporaryFontCache
 
 from docutils import nodes
 from docutils.core import publish_doctree, publish_parts
@@ -22,12 +23,14 @@ class TestRstDirectives(unittest.TestCase):
         docutils.register_directive('blockdiag',
                                     directives.BlockdiagDirectiveBase)
         self._tmpdir = TemporaryDirectory()
+        self._fontcache = TemporaryFontCache()
 
     def tearDown(self):
         if 'blockdiag' in docutils._directives:
             del docutils._directives['blockdiag']
 
         self._tmpdir.clean()
+        self._fontcache.clean()
 
     @property
     def tmpdir(self):
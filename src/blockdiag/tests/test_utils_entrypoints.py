@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from blockdiag import noderenderer
+from blockdiag.utils.entrypoints import iter_entry_points
+
+
+class TestEntryPoints(unittest.TestCase):
+    def test_iter_entry_points(self):
+        names = [ep.name for ep in iter_entry_points('blockdiag_plugins')]
+        self.assertEqual(['attributes', 'autoclass'], sorted(names))
+
+        eps = list(iter_entry_points('blockdiag_imagedrawers',
+                                     'imagedraw_svg'))
+        self.assertEqual(1, len(eps))
+        self.assertEqual('setup', eps[0].load().setup.__name__)
+
+        self.assertEqual([], list(iter_entry_points('unknown_group')))
+
+    def test_load_renderers_lazily(self):
+        from blockdiag.noderenderer.diamond import Diamond
+        self.assertEqual(Diamond, noderenderer.get('flowchart.condition'))
+        self.assertIsNone(noderenderer.get('unknown_shape'))
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from io import BytesIO
+from PIL import Image
+from blockdiag.tests.utils import ImageServer, TemporaryDirectory
+from blockdiag.utils import images, urlcache
+from blockdiag.utils.images import get_image_size, probe_image_size
+
+
+class TestUtilsImages(unittest.TestCase):
+    def image_header(self, _format, size, **kwargs):
+        stream = BytesIO()
+        Image.new('RGB', size).save(stream, _format, **kwargs)
+        return stream.getvalue()
+
+    def test_probe_image_size(self):
+        for _format in ('PNG', 'GIF', 'BMP', 'JPEG', 'WEBP'):
+            header = self.image_header(_format, (123, 45))
+            self.assertEqual((123, 45), probe_image_size(header),
+                             _format)
+
+        header = self.image_header('WEBP', (123, 45), lossless=True)
+        self.assertEqual((123, 45), probe_image_size(header))
+
+    def test_probe_svg_size(self):
+        header = b'<?xml version="1.0"?><svg width="120px" height="40">'
+        self.assertEqual((120, 40), probe_image_size(header))
+
+        header = b'<svg version="1.1" viewBox="0 0 64 32">'
+        self.assertEqual((64, 32), probe_image_size(header))
+
+        header = b'<svg width="50%" height="50%"></svg>'
+        self.assertIsNone(probe_image_size(header))
+
+    def test_probe_truncated_image(self):
+        header = self.image_header('PNG', (123, 45))
+        self.assertIsNone(probe_image_size(header[:20]))
+
+    def test_get_image_size(self):
+        path = os.path.join(os.path.dirname(__file__), 'diagrams', 'white.gif')
+        self.assertEqual((1, 1), tuple(get_image_size(path)))
+
+
+class TestImageSizeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        images._image_size_cache.clear()
+
+    def tearDown(self):
+        self.tmpdir.clean()
+        urlcache.configure()
+
+    def image(self, size):
+        stream = BytesIO()
+        Image.new('RGB', size).save(stream, 'PNG')
+        return stream.getvalue()
+
+    def test_modified_file(self):
+        path = os.path.join(self.tmpdir.name, 'icon.png')
+        with open(path, 'wb') as fd:
+            fd.write(self.image((10, 20)))
+        self.assertEqual((10, 20), tuple(get_image_size(path)))
+        self.assertEqual((10, 20), tuple(get_image_size(path)))
+        self.assertEqual(1, images._image_size_cache.hits)
+
+        with open(path, 'wb') as fd:
+            fd.write(self.image((30, 40)))
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+        self.assertEqual((30, 40), tuple(get_image_size(path)))
+
+    def test_modified_remote_image(self):
+        server = ImageServer(self.image((10, 20)), '"v1"')
+        try:
+            urlcache.configure(ttl=0)
+            url = server.url()
+            urlcache.get(url)
+            self.assertEqual((10, 20), tuple(get_image_size(url)))
+            self.assertEqual((10, 20), tuple(get_image_size(url)))  # 304
+
+            # size follows revalidated content
+            server.update(self.image((30, 40)), '"v2"')
+            self.assertEqual((30, 40), tuple(get_image_size(url)))
+        finally:
+            server.stop()
+
+    def test_cache_is_bounded(self):
+        cache = images._image_size_cache
+        maxsize, cache.maxsize = cache.maxsize, 2
+        try:
+            for i in range(3):
+                path = os.path.join(self.tmpdir.name, '%d.png' % i)
+                with open(path, 'wb') as fd:
+                    fd.write(self.image((10, 20)))
+                get_image_size(path)
+            self.assertEqual(2, len(cache))
+        finally:
+            cache.maxsize = maxsize
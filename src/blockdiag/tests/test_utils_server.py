@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import threading
+from blockdiag.command import BlockdiagApp
+from blockdiag.tests.utils import TemporaryFontCache
+from blockdiag.utils import server
+from blockdiag.utils.server import create_server, parse_address, request_args
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+
+class TestServerUtils(unittest.TestCase):
+    def test_parse_address(self):
+        self.assertEqual(('127.0.0.1', 8080), parse_address('8080'))
+        self.assertEqual(('0.0.0.0', 8080), parse_address('0.0.0.0:8080'))
+        self.assertEqual('/tmp/blockdiag.sock',
+                         parse_address('/tmp/blockdiag.sock'))
+
+        with self.assertRaises(RuntimeError):
+            parse_address('localhost')
+
+    def test_request_args(self):
+        self.assertEqual(['-'], request_args(''))
+        self.assertEqual(['-c', 'config', '-Tsvg', '--antialias',
+                          '--size=320x240', '-'],
+                         request_args('type=svg&antialias&nodoctype=0&'
+                                      'size=320x240', 'config'))
+
+        with self.assertRaises(RuntimeError):
+            request_args('output=/etc/passwd')
+
+
+class TestRenderServer(unittest.TestCase):
+    def setUp(self):
+        self.fontcache = TemporaryFontCache()
+        app = BlockdiagApp()
+        app.parse_options(['-'])
+        app.create_fontmap()
+
+        # render in this process instead of worker pool
+        self.server = create_server('127.0.0.1:0', app.render_source)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.fontcache.clean()
+
+    def post(self, path, body, headers={}):
+        conn = HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            conn.request('POST', path, body, headers)
+            response = conn.getresponse()
+            return (response.status, response.getheader('Content-Type'),
+                    response.read())
+        finally:
+            conn.close()
+
+    def test_render(self):
+        status, content_type, content = self.post('/?type=svg',
+                                                  b'blockdiag { A -> B }')
+        self.assertEqual(200, status)
+        self.assertEqual('image/svg+xml', content_type)
+        self.assertIn(b'<svg', content)
+
+        status, _, content = self.post('/?type=svg', b'blockdiag { A -> ')
+        self.assertEqual(400, status)
+
+    def test_invalid_requests(self):
+        status, _, _ = self.post('/', b'', {'Content-Length': 'abc'})
+        self.assertEqual(400, status)
+
+        length = str(server.MAX_CONTENT_LENGTH + 1)
+        status, _, _ = self.post('/', b'', {'Content-Length': length})
+        self.assertEqual(413, status)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+import time
+import threading
+from blockdiag.tests.utils import ImageServer, TemporaryDirectory
+from blockdiag.utils.urlcache import URLCache
+
+
+class TestURLCache(unittest.TestCase):
+    def setUp(self):
+        self.server = ImageServer()
+        self.url = self.server.url()
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmpdir.clean()
+
+    def test_memory_cache(self):
+        cache = URLCache()
+        self.assertEqual(b'GIF89a', cache.get(self.url))
+        self.assertEqual(b'GIF89a', cache.open(self.url).read())
+        self.assertEqual(1, len(self.server.requests))
+
+        with self.assertRaises(RuntimeError):
+            cache.get(self.url.replace('icon', 'unknown'))
+
+    def test_memory_cache_revalidation(self):
+        cache = URLCache(ttl=0)
+        self.assertEqual(b'GIF89a', cache.get(self.url))
+        self.assertEqual(b'GIF89a', cache.get(self.url))  # 304
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_memory_cache_is_bounded(self):
+        cache = URLCache()
+        cache._contents.maxsize = 2
+        for i in range(3):
+            cache.get(self.url + '?%d' % i)
+        self.assertNotIn(self.url + '?0', cache)
+        self.assertIn(self.url + '?2', cache)
+
+    def test_fetching_does_not_block_other_urls(self):
+        cache = URLCache()
+        slow_url = self.server.url('slow')
+        for i in range(cache.LOCKS):
+            url = slow_url + '?%d' % i
+            if hash(url) % cache.LOCKS != hash(self.url) % cache.LOCKS:
+                break
+
+        thread = threading.Thread(target=cache.get, args=(url,))
+        thread.start()
+        time.sleep(0.1)
+        started = time.time()
+        cache.get(self.url)
+        self.assertLess(time.time() - started, 0.3)
+        thread.join()
+
+    def test_disk_cache(self):
+        cache = URLCache(self.tmpdir.name)
+        self.assertEqual(b'GIF89a', cache.get(self.url))
+
+        # stored contents are used in next run
+        cache = URLCache(self.tmpdir.name)
+        self.assertIn(self.url, cache)
+        self.assertEqual(b'GIF89a', cache.get(self.url))
+        self.assertEqual(1, len(self.server.requests))
+
+        # revalidated after TTL
+        cache = URLCache(self.tmpdir.name, ttl=0)
+        self.assertEqual(b'GIF89a', cache.get(self.url))
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_disk_cache_update(self):
+        URLCache(self.tmpdir.name).get(self.url)
+
+        # modified content replaces stored entry
+        self.server.update(b'GIF89a(modified)', '"v2"')
+        cache = URLCache(self.tmpdir.name, ttl=0)
+        content, meta = cache.entry(self.url)
+        self.assertEqual(b'GIF89a(modified)', content)
+        self.assertEqual('"v2"', meta['etag'])
+
+        cache = URLCache(self.tmpdir.name)
+        self.assertEqual((content, meta), cache.entry(self.url))
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_disk_cache_digest_mismatch(self):
+        cache = URLCache(self.tmpdir.name)
+        digest = cache.entry(self.url)[1]['digest']
+
+        # content replaced by other process (metadata not yet)
+        with open(cache.path(self.url), 'wb') as fd:
+            fd.write(b'GIF87a')
+
+        cache = URLCache(self.tmpdir.name)
+        content, meta = cache.entry(self.url)
+        self.assertEqual(b'GIF89a', content)
+        self.assertEqual(digest, meta['digest'])
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_offline(self):
+        URLCache(self.tmpdir.name).get(self.url)
+
+        cache = URLCache(self.tmpdir.name, ttl=0, offline=True)
+        self.assertEqual(b'GIF89a', cache.get(self.url))
+        with self.assertRaises(RuntimeError):
+            cache.get(self.url.replace('icon', 'unknown'))
+        self.assertEqual(1, len(self.server.requests))
@@ -9,7 +9,9 @@ else:
 
 import os
 import re
+import time
 import functools
+import threading
 from shutil import rmtree
 from tempfile import mkdtemp, mkstemp
 from blockdiag.builder import ScreenNodeBuilder
@@ -22,6 +24,13 @@ except ImportError:
     # sys.stderr in py3.x allows only str objects (disallow bytes objs)
     from io import StringIO
 
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
 
 def supported_pil():
     try:
@@ -56,6 +65,20 @@ def with_pdf(fn):
     return fn
 
 
+def truetype_fontpath():
+    """Return path of a TrueType font for tests (bundled with reportlab)"""
+    try:
+        import reportlab
+        fontdir = os.path.join(os.path.dirname(reportlab.__file__), 'fonts')
+        path = os.path.join(fontdir, 'Vera.ttf')
+        if os.path.exists(path):
+            return path
+    except ImportError:
+        pass
+
+    return None
+
+
 def capture_stderr(func):
     def wrap(*args, **kwargs):
         try:
@@ -94,6 +117,81 @@ class TemporaryDirectory(object):
         return mkstemp(suffix, prefix, self.name, text)
 
 
+class TemporaryFontCache(TemporaryDirectory):
+    """Store results of font search into temporary directory"""
+
+    def __init__(self):
+        super(TemporaryFontCache, self).__init__()
+        self.xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.name
+
+    def clean(self):
+        if os.environ.get('XDG_CACHE_HOME') == self.name:
+            if self.xdg_cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = self.xdg_cache_home
+
+        super(TemporaryFontCache, self).clean()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serve /icon.gif (and /slow) supporting ETag revalidation"""
+    content = b'GIF89a'
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+
+        if self.path.split('?')[0] not in ('/icon.gif', '/slow'):
+            self.send_response(404)
+            self.end_headers()
+        elif self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', str(len(self.content)))
+            self.end_headers()
+            self.wfile.write(self.content)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageServer(ThreadingMixIn, HTTPServer):
+    """HTTP server for tests; serves contents by ImageHandler"""
+    daemon_threads = True
+
+    def __init__(self, content=b'GIF89a', etag='"v1"'):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ImageHandler)
+        ImageHandler.requests = []
+        self.update(content, etag)
+
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def requests(self):
+        return ImageHandler.requests
+
+    def url(self, path='icon.gif'):
+        return 'http://127.0.0.1:%d/%s' % (self.server_port, path)
+
+    def update(self, content, etag):
+        ImageHandler.content = content
+        ImageHandler.etag = etag
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
 class BuilderTestCase(unittest.TestCase):
     def build(self, filename):
         basedir = os.path.dirname(__file__)
@@ -37,6 +37,9 @@ class XY(tuple):
     def __setattr__(self, name, value):
         raise TypeError("'XY' object does not support item assignment")
 
+    def __getnewargs__(self):
+        return tuple(self)
+
     def shift(self, x=0, y=0):
         return self.__class__(self.x + x, self.y + y)
 
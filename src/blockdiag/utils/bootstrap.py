@@ -16,9 +16,16 @@
 import os
 import re
 import sys
+import copy
+import glob
+import json
 import codecs
+import signal
+import tempfile
 from optparse import OptionParser, SUPPRESS_HELP
 from blockdiag import imagedraw
+from blockdiag.imagedraw.displaylist import render_pages
+from blockdiag.utils import urlcache
 from blockdiag.utils.compat import u
 from blockdiag.utils.config import ConfigParser
 from blockdiag.utils.fontmap import parse_fontpath, FontMap
@@ -32,6 +39,14 @@ class Application(object):
         try:
             self.parse_options(args)
             self.create_fontmap()
+            self.setup_urlcache()
+
+            if self.options.serve:
+                return self.serve()
+            elif self.options.multipage:
+                return self.build_pages()
+            elif self.options.batch:
+                return self.build_batch()
 
             parsed = self.parse_diagram()
             return self.build_diagram(parsed)
@@ -56,6 +71,10 @@ class Application(object):
     def create_fontmap(self):
         self.fontmap = create_fontmap(self.options)
 
+    def setup_urlcache(self):
+        urlcache.configure(self.options.cache_dir, self.options.cache_ttl,
+                           self.options.offline)
+
     def parse_diagram(self):
         if self.options.input == '-':
             stream = codecs.getreader('utf-8-sig')(sys.stdin)
@@ -66,25 +85,202 @@ class Application(object):
 
         return self.module.parser.parse_string(self.code)
 
+    def drawing_options(self):
+        return dict(fontmap=self.fontmap, code=self.code,
+                    antialias=self.options.antialias,
+                    antialias_mode=self.options.antialias_mode,
+                    supersampling=self.options.supersampling,
+                    tiled=self.options.tiled,
+                    nodoctype=self.options.nodoctype,
+                    compact=self.options.compact,
+                    external_images=self.options.external_images,
+                    precision=self.options.precision,
+                    shadow_compositing=self.options.shadow_compositing,
+                    transparency=self.options.transparency)
+
     def build_diagram(self, tree):
         DiagramDraw = self.module.drawer.DiagramDraw
 
         diagram = self.module.builder.ScreenNodeBuilder.build(tree)
+        options = self.drawing_options()
+
+        displaylist = None
+        outputs = list(zip(self.options.types, self.options.outputs))
+        for _type, output in outputs:
+            if len(outputs) == 1 or self.draw_directly(_type):
+                drawer = DiagramDraw(_type, diagram, output, **options)
+                drawer.draw()
+
+                if self.options.size:
+                    drawer.save(size=self.options.size)
+                else:
+                    drawer.save()
+            else:
+                # record drawing operations once; replay them to each format
+                if displaylist is None:
+                    drawer = DiagramDraw('DISPLAYLIST', diagram, **options)
+                    drawer.draw()
+                    displaylist = drawer.save()
 
-        drawer = DiagramDraw(self.options.type, diagram,
-                             self.options.output, fontmap=self.fontmap,
-                             code=self.code, antialias=self.options.antialias,
-                             nodoctype=self.options.nodoctype,
-                             transparency=self.options.transparency)
-        drawer.draw()
+                displaylist.render(_type, output, self.options.size,
+                                   **options)
 
-        if self.options.size:
-            drawer.save(size=self.options.size)
+        return 0
+
+    def build_pages(self):
+        DiagramDraw = self.module.drawer.DiagramDraw
+
+        displaylists = []
+        for filename in self.options.inputs:
+            self.options.input = filename
+            tree = self.parse_diagram()
+            diagram = self.module.builder.ScreenNodeBuilder.build(tree)
+
+            drawer = DiagramDraw('DISPLAYLIST', diagram,
+                                 **self.drawing_options())
+            drawer.draw()
+            displaylists.append(drawer.save())
+
+        options = self.drawing_options()
+        del options['code']  # not for each page
+        render_pages(displaylists, self.options.type, self.options.output,
+                     **options)
+
+        return 0
+
+    def build_batch(self):
+        inputs = self.options.inputs
+        outputs = set()
+        for filename in inputs:
+            for output in self.output_filenames(filename):
+                if output in outputs:
+                    msg = "several input files are written to: %s" % output
+                    raise RuntimeError(msg)
+                outputs.add(output)
+
+        outdir = self.options.outdir
+        if outdir and not os.path.isdir(outdir):
+            os.makedirs(outdir)
+
+        jobs = min(self.options.jobs or cpu_count(), len(inputs))
+        if jobs == 1:
+            pool = None
+            results = (self.build_file(filename) for filename in inputs)
         else:
-            drawer.save()
+            # fontmap is created once; workers take over it
+            from multiprocessing import Pool
+            pool = Pool(jobs, init_worker,
+                        (self.__class__, self.options, self.fontmap))
+            results = pool.imap(build_file, inputs, 1)
+
+        failed = 0
+        try:
+            for filename, error in zip(inputs, results):
+                if error:
+                    failed += 1
+                    sys.stderr.write(u("ERROR: %s: %s\n") % (filename, error))
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+        if failed:
+            return -1
+        else:
+            return 0
+
+    def build_file(self, filename):
+        """Render a file of batch; returns error message on failure"""
+        options = self.options
+        try:
+            self.options = copy.copy(options)
+            self.options.input = filename
+            self.options.outputs = self.output_filenames(filename)
+            self.options.output = self.options.outputs[0]
+
+            self.build_diagram(self.parse_diagram())
+            return None
+        except Exception as e:
+            return format_error(e, options.debug)
+        finally:
+            self.options = options
+
+    def serve(self):
+        from multiprocessing import Pool
+        from blockdiag.utils.server import create_server
+
+        # workers take over fontmap, and keep their caches during serving
+        self.pool = Pool(self.options.jobs or cpu_count(), init_worker,
+                         (self.__class__, self.options, self.fontmap))
+        server = create_server(self.options.serve, self.render_request,
+                               self.options.debug)
+
+        # shut down workers and remove socket on kill (not inherited by pool)
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.pool.terminate()
+            self.pool.join()
 
         return 0
 
+    def render_request(self, source, query):
+        # called from threads of server; pool bounds concurrent renderings
+        return self.pool.apply(render_source, (source, query))
+
+    def render_source(self, source, query):
+        """Render source of a request to status, content type and image"""
+        from blockdiag.utils.server import request_args, CONTENT_TYPES
+
+        options = self.options
+        output = None
+        try:
+            self.parse_options(request_args(query, options.config))
+            _type = self.options.type
+            if self.options.types[1:] or _type not in CONTENT_TYPES:
+                types = ','.join(self.options.types)
+                msg = "could not serve format: %s" % types
+                raise RuntimeError(msg)
+
+            fd, output = tempfile.mkstemp(suffix='.' + _type.lower())
+            os.close(fd)
+            self.options.output = output
+            self.options.outputs = [output]
+
+            self.code = source.decode('utf-8-sig')
+            self.build_diagram(self.module.parser.parse_string(self.code))
+            with open(output, 'rb') as fd:
+                return (200, CONTENT_TYPES[_type], fd.read())
+        except SystemExit:  # raised by OptionParser
+            msg = u("invalid options: %s") % query
+        except Exception as e:
+            msg = format_error(e, options.debug)
+        finally:
+            self.options = options
+            if output and os.path.exists(output):
+                os.remove(output)
+
+        return (400, 'text/plain; charset=utf-8', msg.encode('utf-8'))
+
+    def output_filenames(self, filename):
+        basename = os.path.splitext(filename)[0]
+        if self.options.outdir:
+            basename = os.path.join(self.options.outdir,
+                                    os.path.basename(basename))
+
+        return ['%s.%s' % (basename, _type.lower())
+                for _type in self.options.types]
+
+    def draw_directly(self, _type):
+        # display list is recorded at 1x; supersampling needs whole page
+        return (_type == 'PNG' and self.options.antialias and
+                self.options.antialias_mode == 'supersample' and
+                not self.options.tiled)
+
 
 class Options(object):
     def __init__(self, module):
@@ -104,12 +300,45 @@ class Options(object):
         self.parser = p = OptionParser(usage=usage, version=version)
         p.add_option('-a', '--antialias', action='store_true',
                      help='Pass diagram image to anti-alias filter')
+        p.add_option('--antialias-mode', dest='antialias_mode',
+                     default='supersample', metavar='MODE',
+                     type='choice', choices=['supersample', 'primitive'],
+                     help='Method of anti-alias filter: supersample ' +
+                          '(default) or primitive (PNG only)')
+        p.add_option('--supersampling', type='int', default=2, metavar='N',
+                     help='Scale factor of anti-alias filter (default: 2)')
+        p.add_option('--batch', action='store_true',
+                     help='Render each of input files (or wildcards) to ' +
+                          'its own images; -o names output directory')
+        p.add_option('--cache-dir', dest='cache_dir', metavar='DIR',
+                     help='Store remote images (icons and backgrounds) ' +
+                          'to DIR, and reuse them on next run')
+        p.add_option('--cache-ttl', dest='cache_ttl', type='int',
+                     metavar='SECONDS',
+                     help='Revalidate stored remote images after SECONDS ' +
+                          '(default: 86400)')
+        p.add_option('--compact', action='store_true',
+                     help='Output compact images; share styles and merge ' +
+                          'edges (SVG only)')
         p.add_option('-c', '--config',
                      help='read configurations from FILE', metavar='FILE')
         p.add_option('--debug', action='store_true',
                      help='Enable debug mode')
+        p.add_option('-j', '--jobs', type='int', metavar='N',
+                     help='Number of processes to render files in batch ' +
+                          'mode (default: number of CPUs)')
+        p.add_option('--manifest', metavar='FILE',
+                     help='Read input files from FILE, one per line ' +
+                          '(implies --batch)')
+        p.add_option('--multipage', action='store_true',
+                     help='Output all of input files as pages of one ' +
+                          'document (PDF only)')
         p.add_option('-o', dest='output',
                      help='write diagram to FILE', metavar='FILE')
+        p.add_option('--external-images', dest='external_images',
+                     action='store_true',
+                     help='Refer local images by path instead of ' +
+                          'embedding them (SVG only)')
         p.add_option('-f', '--font', default=[], action='append',
                      help='use FONT to draw diagram', metavar='FONT')
         p.add_option('--fontmap',
@@ -120,36 +349,89 @@ class Options(object):
                      default=True, action='store_false',
                      help='do not make transparent background of diagram ' +
                           '(PNG only)')
+        p.add_option('--offline', action='store_true',
+                     help='Use stored remote images without accessing ' +
+                          'to network (requires --cache-dir)')
+        p.add_option('--precision', type='int', metavar='N',
+                     help='Number of decimal places of coordinates in ' +
+                          'compact images (default: 2)')
+        p.add_option('--serve', metavar='ADDRESS',
+                     help='Run as server rendering sources posted to ' +
+                          'ADDRESS (PORT, HOST:PORT or path of unix socket)')
+        p.add_option('--shadow-compositing', dest='shadow_compositing',
+                     metavar='MODE', type='choice', choices=['shape', 'layer'],
+                     help='Method of blurring shadows: shape (default; ' +
+                          'each shape) or layer (all at once) (PNG only)')
         p.add_option('--size',
                      help='Size of diagram (ex. 320x240)')
+        p.add_option('--tiled', action='store_true',
+                     help='Render diagram image by bands of rows to ' +
+                          'reduce memory usage (PNG only)')
         p.add_option('-T', dest='type', default='PNG',
-                     help='Output diagram as TYPE format')
+                     help='Output diagram as TYPE format (comma separated ' +
+                          'list of types to output several formats at once)')
         p.add_option('--nodoctype', action='store_true',
                      help='Do not output doctype definition tags (SVG only)')
 
         return p
 
     def validate(self):
+        if self.options.manifest:
+            self.options.batch = True
+            self.args += read_manifest(self.options.manifest)
+
+        if self.options.serve:
+            from blockdiag.utils.server import parse_address
+            parse_address(self.options.serve)
+            if self.args:
+                msg = "--serve option does not take input files."
+                raise RuntimeError(msg)
+            self.args = ['-']  # sources are posted to server
+
         if len(self.args) == 0:
             self.parser.print_help()
             sys.exit(0)
 
         self.options.input = self.args.pop(0)
-        if self.options.output:
-            pass
-        elif self.options.output == '-':
-            self.options.output = 'output.' + self.options.type.lower()
-        else:
-            basename = os.path.splitext(self.options.input)[0]
-            ext = '.%s' % self.options.type.lower()
-            self.options.output = basename + ext
+        self.options.inputs = [self.options.input]
+        self.options.outdir = None
+        if self.options.multipage:
+            self.options.inputs += self.args
+        elif self.options.batch:
+            self.options.inputs = expand_inputs(self.options.inputs +
+                                                self.args)
+            self.options.input = self.options.inputs[0]
+
+            # -o names directory of output files in batch mode
+            self.options.outdir = self.options.output
+            self.options.output = None
+        self.options.types = [t.strip().upper()
+                              for t in self.options.type.split(',')]
+        basename = os.path.splitext(self.options.input)[0]
+        if self.options.output and len(self.options.types) == 1:
+            self.options.outputs = [self.options.output]
+        elif self.options.output:
+            # -o a.svg,a.png (each type) or -o a.svg (replace extensions)
+            self.options.outputs = self.options.output.split(',')
+            if len(self.options.outputs) == 1:
+                basename = os.path.splitext(self.options.output)[0]
+                self.options.outputs = []
+            elif len(self.options.outputs) != len(self.options.types):
+                msg = "-o option must have same number of files as -T."
+                raise RuntimeError(msg)
 
-        self.options.type = self.options.type.upper()
-        try:
-            imagedraw.create(self.options.type, None)
-        except:
-            msg = "unknown format: %s" % self.options.type
-            raise RuntimeError(msg)
+        if not self.options.output or not self.options.outputs:
+            self.options.outputs = ['%s.%s' % (basename, _type.lower())
+                                    for _type in self.options.types]
+
+        self.options.type = self.options.types[0]
+        self.options.output = self.options.outputs[0]
+        for _type in self.options.types:
+            try:
+                imagedraw.create(_type, None)
+            except:
+                msg = "unknown format: %s" % _type
+                raise RuntimeError(msg)
 
         if self.options.size:
             matched = re.match('^(\d+)x(\d+)$', self.options.size)
@@ -159,7 +441,7 @@ class Options(object):
                 msg = "--size option must be formatted as WIDTHxHEIGHT."
                 raise RuntimeError(msg)
 
-        if self.options.type == 'PDF':
+        if 'PDF' in self.options.types:
             try:
                 import reportlab.pdfgen.canvas
                 reportlab.pdfgen.canvas
@@ -172,14 +454,73 @@ class Options(object):
                   "(detect automatically).\n"
             sys.stderr.write(msg)
 
-        if self.options.nodoctype and self.options.type != 'SVG':
+        if self.options.nodoctype and 'SVG' not in self.options.types:
             msg = "--nodoctype option work in SVG images."
             raise RuntimeError(msg)
 
-        if self.options.transparency is False and self.options.type != 'PNG':
+        if self.options.compact and 'SVG' not in self.options.types:
+            msg = "--compact option work in SVG images."
+            raise RuntimeError(msg)
+
+        if self.options.external_images and 'SVG' not in self.options.types:
+            msg = "--external-images option work in SVG images."
+            raise RuntimeError(msg)
+
+        if self.options.precision is not None:
+            if not self.options.compact:
+                msg = "--precision option work with --compact option."
+                raise RuntimeError(msg)
+            elif self.options.precision < 0:
+                msg = "--precision option must be 0 or greater."
+                raise RuntimeError(msg)
+
+        if (self.options.transparency is False and
+                not set(self.options.types) & set(['PNG', 'DZI'])):
             msg = "--no-transparency option work in PNG images."
             raise RuntimeError(msg)
 
+        if self.options.multipage and self.options.types != ['PDF']:
+            msg = "--multipage option work in PDF images."
+            raise RuntimeError(msg)
+
+        if self.options.batch and self.options.multipage:
+            msg = "--batch option does not work with --multipage option."
+            raise RuntimeError(msg)
+
+        if self.options.serve and (self.options.batch or
+                                   self.options.multipage):
+            msg = "--serve option does not work with --batch or --multipage."
+            raise RuntimeError(msg)
+
+        if self.options.batch and '-' in self.options.inputs:
+            msg = "--batch option could not read from stdin."
+            raise RuntimeError(msg)
+
+        if self.options.jobs is not None:
+            if not (self.options.batch or self.options.serve):
+                msg = "--jobs option work in batch or server mode."
+                raise RuntimeError(msg)
+            elif self.options.jobs < 1:
+                msg = "--jobs option must be 1 or greater."
+                raise RuntimeError(msg)
+
+        if (self.options.shadow_compositing and
+                not set(self.options.types) & set(['PNG', 'DZI'])):
+            msg = "--shadow-compositing option work in PNG images."
+            raise RuntimeError(msg)
+
+        if self.options.tiled and 'PNG' not in self.options.types:
+            msg = "--tiled option work in PNG images."
+            raise RuntimeError(msg)
+
+        if self.options.supersampling < 2:
+            msg = "--supersampling option must be 2 or greater."
+            raise RuntimeError(msg)
+
+        if self.options.cache_ttl is not None and self.options.cache_ttl < 0:
+            msg = "--cache-ttl option must be 0 or greater."
+            raise RuntimeError(msg)
+
         if self.options.config and not os.path.isfile(self.options.config):
             msg = "config file is not found: %s" % self.options.config
             raise RuntimeError(msg)
@@ -211,6 +552,10 @@ class Options(object):
                 if self.options.fontmap is None:
                     self.options.fontmap = config.get(appname, 'fontmap')
 
+            if config.has_option(appname, 'cachedir'):
+                if self.options.cache_dir is None:
+                    self.options.cache_dir = config.get(appname, 'cachedir')
+
             if config.has_option(appname, 'antialias'):
                 antialias = config.get(appname, 'antialias')
                 if antialias.lower() == 'true':
@@ -219,9 +564,83 @@ class Options(object):
             if self.options.fontmap is None:
                 self.options.fontmap = configpath
 
+        if self.options.offline and not self.options.cache_dir:
+            msg = "--offline option requires --cache-dir option."
+            raise RuntimeError(msg)
+
+
+def read_manifest(path):
+    if not os.path.isfile(path):
+        msg = "manifest file is not found: %s" % path
+        raise RuntimeError(msg)
+
+    # entries are relative to the manifest file
+    basedir = os.path.dirname(path)
+    with codecs.open(path, 'r', 'utf-8-sig') as fd:
+        lines = (line.strip() for line in fd)
+        return [os.path.join(basedir, line) for line in lines
+                if line and not line.startswith('#')]
+
+
+def expand_inputs(patterns):
+    """Expand wildcards in input filenames (for shells without globbing)"""
+    inputs = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            filenames = sorted(glob.glob(pattern))
+        else:
+            filenames = [pattern]
+
+        for filename in filenames:
+            if filename not in inputs:
+                inputs.append(filename)
+
+    if not inputs:
+        msg = "no input files matched: %s" % ' '.join(patterns)
+        raise RuntimeError(msg)
+
+    return inputs
+
+
+def cpu_count():
+    try:
+        from multiprocessing import cpu_count
+        return cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+worker = None  # Application in worker processes of batch mode
+
+
+def init_worker(cls, options, fontmap):
+    global worker
+    worker = cls()
+    worker.options = options
+    worker.fontmap = fontmap
+    worker.setup_urlcache()
+
+
+def build_file(filename):
+    return worker.build_file(filename)
+
+
+def render_source(source, query):
+    return worker.render_source(source, query)
+
+
+def format_error(exc, debug=False):
+    """Describe the exception being handled"""
+    if isinstance(exc, UnicodeEncodeError):
+        return "UnicodeEncodeError caught (check your font settings)"
+    elif debug:
+        import traceback
+        return traceback.format_exc()
+    else:
+        return u("%s") % exc
+
 
 def detectfont(options):
-    import glob
     fontdirs = [
         '/usr/share/fonts',
         '/Library/Fonts',
@@ -252,13 +671,69 @@ def detectfont(options):
             raise RuntimeError(msg)
 
     if fontpath is None:
-        globber = (glob.glob(d) for d in fontdirs)
-        for fontdir in sum(globber, []):
-            for root, _, files in os.walk(fontdir):
-                for font in fontfiles:
-                    if font in files:
-                        fontpath = os.path.join(root, font)
-                        break
+        fontpath = search_fontfile(fontdirs, fontfiles, fontcache_path())
+
+    return fontpath
+
+
+def fontcache_path():
+    cachedir = os.environ.get('XDG_CACHE_HOME')
+    if not cachedir and os.environ.get('HOME'):
+        cachedir = os.path.join(os.environ.get('HOME'), '.cache')
+
+    if cachedir:
+        return os.path.join(cachedir, 'blockdiag', 'fonts.json')
+    else:
+        return None
+
+
+def search_fontfile(fontdirs, fontfiles, cachepath=None):
+    """Search font files from directories.
+
+    The result is stored into *cachepath* with mtimes of the directories,
+    and reused until any of the directories are modified.
+    """
+    key = dict(fontdirs=fontdirs, fontfiles=fontfiles)
+    globber = (glob.glob(d) for d in fontdirs)
+    topdirs = sum(globber, [])
+    try:
+        with open(cachepath) as fd:
+            cache = json.load(fd)
+
+        if cache['key'] == key and cache['topdirs'] == topdirs:
+            mtimes = cache['mtimes']
+            if all(os.stat(path).st_mtime == mtimes[path] for path in mtimes):
+                fontpath = cache['fontpath']
+                if fontpath is None or os.path.isfile(fontpath):
+                    return fontpath
+    except (TypeError, IOError, OSError, ValueError, KeyError):
+        pass  # no cache or modified directories
+
+    fontpath = None
+    mtimes = {}
+    for fontdir in topdirs:
+        for root, _, files in os.walk(fontdir):
+            mtimes[root] = os.stat(root).st_mtime
+            for font in fontfiles:
+                if font in files:
+                    fontpath = os.path.join(root, font)
+                    break
+
+    if cachepath:
+        cache = dict(key=key, topdirs=topdirs, mtimes=mtimes,
+                     fontpath=fontpath)
+        try:
+            cachedir = os.path.dirname(cachepath)
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+
+            # write atomically; blockdiag might be invoked in parallel
+            fd, tmpname = tempfile.mkstemp(dir=cachedir)
+            with os.fdopen(fd, 'w') as stream:
+                json.dump(cache, stream)
+            os.rename(tmpname, cachepath)
+        except (IOError, OSError):
+            pass  # cache is not writable
 
     return fontpath
 
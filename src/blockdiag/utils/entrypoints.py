@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# entry points of each group; discovered once in the process
+registry = {}
+
+
+def iter_entry_points(group, name=None):
+    """Iterate entry points of the group (without importing pkg_resources)
+
+    Entry points are not loaded; call load() of them to import modules.
+    """
+    if group not in registry:
+        entry_points = []
+        values = set()
+        for ep in find_entry_points(group):
+            # a distribution might be found twice through sys.path
+            value = (ep.name, getattr(ep, 'value', None) or str(ep))
+            if value not in values:
+                values.add(value)
+                entry_points.append(ep)
+
+        registry[group] = entry_points
+
+    for ep in registry[group]:
+        if name is None or ep.name == name:
+            yield ep
+
+
+def find_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python 3.7 or older
+        from pkg_resources import iter_entry_points
+        return iter_entry_points(group)
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=group)
+    else:  # Python 3.8 and 3.9
+        return eps.get(group, [])
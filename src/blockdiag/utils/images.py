@@ -14,8 +14,12 @@
 #  limitations under the License.
 
 from __future__ import division
+import os
 import re
-from blockdiag.utils import urlutil
+import time
+import struct
+from blockdiag.utils import urlcache, urlutil
+from blockdiag.utils.cache import LRUCache
 from blockdiag.utils.compat import string_types
 
 try:
@@ -53,33 +57,202 @@ except ImportError:
 
             return size
 
-_image_size_cache = {}
+# sizes of images; keyed by filename and its stamp (see image_stamp())
+_image_size_cache = LRUCache(maxsize=256)
+
+# size of header to probe image size; larger one is used for JPEG images
+# having big application segments (like EXIF thumbnails)
+PROBE_SIZES = (4096, 131072)
 
 
 def get_image_size(filename):
-    if filename not in _image_size_cache:
-        uri = filename
-        if urlutil.isurl(filename):
-            try:
-                from io import BytesIO as StringIO
-            except ImportError:
-                from cStringIO import StringIO
-            try:
-                from urllib.request import urlopen
-            except ImportError:
-                from urllib import urlopen
+    key = (filename, image_stamp(filename))
+    size = _image_size_cache.get(key)
+    if size is None:
+        for length in PROBE_SIZES:
+            header = read_header(filename, length)
+            size = probe_image_size(header)
+            if size or len(header) < length:  # detected or whole of the file
+                break
+
+        if size is None:
+            size = decode_image_size(filename)
+
+        _image_size_cache.set(key, size)
+
+    return size
+
+
+def image_stamp(filename):
+    """Return a stamp of the image; it changes when the image is modified
+
+    Stamps of local files are their mtime, and ones of remote images are
+    digests of the contents revalidated by urlcache.
+    """
+    cache = urlcache.cache
+    if not urlutil.isurl(filename):
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+    elif cache.directory or cache.offline or filename in cache:
+        return cache.entry(filename)[1]['digest']
+    else:
+        # probed partially (not cached in urlcache); probe again after TTL
+        return int(time.time() // max(cache.ttl, 1))
+
+
+def open_partially(url, length):
+    """Open URL to read first *length* bytes only (by Range request)"""
+    try:
+        from urllib.request import urlopen, Request
+    except ImportError:
+        from urllib2 import urlopen, Request
+
+    request = Request(url)
+    request.add_header('Range', 'bytes=0-%d' % (length - 1))
+
+    try:
+        return urlopen(request)
+    except IOError:
+        raise RuntimeError('Could not retrieve: %s' % url)
 
-            try:
-                uri = StringIO(urlopen(filename).read())
-            except IOError:
-                raise RuntimeError('Could not retrieve: %s' % filename)
 
+def read_header(filename, length):
+    """Read first *length* bytes of the image (URLs are read partially)"""
+    cache = urlcache.cache
+    if urlutil.isurl(filename):
+        if cache.directory or cache.offline or filename in cache:
+            # fetch whole of the image once; it is stored for drawing
+            return cache.get(filename)[:length]
+        else:
+            stream = open_partially(filename, length)
+    else:
         try:
-            _image_size_cache[filename] = Image.open(uri).size
-        except:
+            stream = open(filename, 'rb')
+        except IOError:
             raise RuntimeError('Colud not get size of image: %s' % filename)
 
-    return _image_size_cache[filename]
+    try:
+        return stream.read(length)
+    except IOError:
+        return b''
+    finally:
+        stream.close()
+
+
+def decode_image_size(filename):
+    """Get size of the image by decoding whole of the image"""
+    uri = filename
+    if urlutil.isurl(filename):
+        uri = urlcache.open_url(filename)
+
+    try:
+        return Image.open(uri).size
+    except:
+        raise RuntimeError('Colud not get size of image: %s' % filename)
+
+
+def probe_image_size(header):
+    """Detect size of the image from its header; returns None if unknown"""
+    try:
+        if header.startswith(b'\x89PNG\r\n\x1a\n'):
+            return struct.unpack('>II', header[16:24])
+        elif header[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', header[6:10])
+        elif header.startswith(b'\xff\xd8'):
+            return probe_jpeg_size(header)
+        elif header.startswith(b'BM'):
+            return probe_bmp_size(header)
+        elif header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+            return probe_webp_size(header)
+        elif re.search(b'<svg', header[:1024]):
+            return probe_svg_size(header)
+    except struct.error:  # header is truncated
+        pass
+
+    return None
+
+
+def probe_jpeg_size(header):
+    SOF_MARKERS = [m for m in range(0xc0, 0xd0) if m not in (0xc4, 0xc8, 0xcc)]
+    STANDALONE_MARKERS = [0x01] + list(range(0xd0, 0xda))
+
+    pos = 2
+    while pos < len(header):
+        prefix, marker = struct.unpack('>BB', header[pos:pos + 2])
+        if prefix != 0xff:
+            return None  # broken image
+        elif marker == 0xff:  # fill byte
+            pos += 1
+        elif marker in SOF_MARKERS:
+            height, width = struct.unpack('>HH', header[pos + 5:pos + 9])
+            return (width, height)
+        elif marker in STANDALONE_MARKERS:
+            pos += 2
+        else:
+            length = struct.unpack('>H', header[pos + 2:pos + 4])[0]
+            pos += 2 + length
+
+    return None
+
+
+def probe_bmp_size(header):
+    if struct.unpack('<I', header[14:18])[0] == 12:  # OS/2 bitmap
+        return struct.unpack('<HH', header[18:22])
+    else:
+        width, height = struct.unpack('<ii', header[18:26])
+        return (width, abs(height))  # top-down bitmaps have negative height
+
+
+def probe_webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', header[26:30])
+        return (width & 0x3fff, height & 0x3fff)
+    elif chunk == b'VP8L':
+        b0, b1, b2, b3 = struct.unpack('<BBBB', header[21:25])
+        width = (b0 | (b1 & 0x3f) << 8) + 1
+        height = (b1 >> 6 | b2 << 2 | (b3 & 0x0f) << 10) + 1
+        return (width, height)
+    elif chunk == b'VP8X':
+        width = struct.unpack('<I', header[24:27] + b'\x00')[0] + 1
+        height = struct.unpack('<I', header[27:30] + b'\x00')[0] + 1
+        return (width, height)
+
+    return None
+
+
+def probe_svg_size(header):
+    matched = re.search(br'<svg\s[^>]*>', header)
+    if matched is None:
+        return None
+
+    def attribute(name):
+        pattern = br'\s' + name + br'\s*=\s*["\']([^"\']*)["\']'
+        attr = re.search(pattern, matched.group(0))
+        if attr:
+            return attr.group(1).decode('utf-8').strip()
+
+    def length(value):
+        number = re.match(r'^(\d+(?:\.\d*)?)(px)?$', value or '')
+        if number:
+            return int(round(float(number.group(1))))
+
+    width = length(attribute(b'width'))
+    height = length(attribute(b'height'))
+    if width and height:
+        return (width, height)
+
+    viewbox = (attribute(b'viewBox') or '').replace(',', ' ').split()
+    if len(viewbox) == 4:
+        try:
+            width, height = [int(round(float(n))) for n in viewbox[2:]]
+            return (width, height)
+        except ValueError:
+            pass
+
+    return None
 
 
 def calc_image_size(size, bounded):
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import sys
+import stat
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import urlparse, parse_qsl
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import urlparse, parse_qsl
+
+
+MAX_CONTENT_LENGTH = 1024 * 1024  # bytes
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """Render source code in body of POST request
+
+    Options are given as query string (ex. ``/?type=svg&antialias``).
+    """
+
+    def do_POST(self):
+        length = self.headers.get('Content-Length') or '0'
+        if not length.isdigit():
+            return self.send_error(400, 'Invalid Content-Length')
+        elif int(length) > MAX_CONTENT_LENGTH:
+            return self.send_error(413, 'Source is too large')
+
+        source = self.rfile.read(int(length))
+        query = urlparse(self.path).query
+
+        status, content_type, content = self.server.render(source, query)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.debug:
+            sys.stderr.write("%s\n" % (format % args))
+
+
+class TCPRenderServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixRenderServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if is_socket(self.server_address):  # left by previous server
+            os.unlink(self.server_address)
+
+        UnixStreamServer.server_bind(self)
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if is_socket(self.server_address):
+            os.unlink(self.server_address)
+
+
+def is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def parse_address(address):
+    """Parse address to listen: PORT, HOST:PORT or path of unix socket"""
+    if '/' in address:
+        return address
+
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        msg = "--serve option must be PORT, HOST:PORT or path of socket."
+        raise RuntimeError(msg)
+
+    return (host or '127.0.0.1', int(port))
+
+
+def create_server(address, render, debug=False):
+    """Create a server which calls render(source, query) for each request
+
+    render() returns a tuple of status code, content type and content.
+    """
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        server = TCPRenderServer(address, RenderRequestHandler)
+    else:
+        server = UnixRenderServer(address, RenderRequestHandler)
+
+    server.render = render
+    server.debug = debug
+    return server
+
+
+# options which can be given to each request as query string
+REQUEST_OPTIONS = ('antialias-mode', 'precision', 'size', 'supersampling')
+REQUEST_FLAGS = ('antialias', 'compact', 'external-images', 'no-transparency',
+                 'nodoctype')
+
+CONTENT_TYPES = {
+    'SVG': 'image/svg+xml',
+    'PNG': 'image/png',
+    'PDF': 'application/pdf',
+}
+
+
+def request_args(query, config=None):
+    """Convert query string of a request to command line arguments"""
+    args = []
+    if config:
+        args += ['-c', config]
+
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name == 'type':
+            args.append('-T' + value)
+        elif name in REQUEST_OPTIONS:
+            args.append('--%s=%s' % (name, value))
+        elif name in REQUEST_FLAGS:
+            if value.lower() not in ('0', 'false', 'no', 'off'):
+                args.append('--' + name)
+        else:
+            raise RuntimeError("unknown option: %s" % name)
+
+    return args + ['-']  # source is given as body of request
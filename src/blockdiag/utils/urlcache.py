@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2011 Takeshi KOMIYA
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from io import BytesIO
+from blockdiag.utils.cache import LRUCache
+
+try:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, Request, HTTPError
+
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+
+
+class URLCache(object):
+    """Cache of contents of remote images.
+
+    Recently used contents are kept in memory, and revalidated after
+    *ttl* seconds.  If *directory* is given, they are also stored in the
+    directory with their ETag and Last-Modified headers, and reused by
+    other processes.  In *offline* mode, the stored contents are used
+    regardless of their age, and the network is never accessed.
+    """
+    MAX_ENTRIES = 256
+    LOCKS = 64
+
+    def __init__(self, directory=None, ttl=DEFAULT_TTL, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self._contents = LRUCache(maxsize=self.MAX_ENTRIES)
+
+        # fetching a URL blocks requests for same URL only (mostly)
+        self._locks = [threading.Lock() for _ in range(self.LOCKS)]
+
+    def __contains__(self, url):
+        if url in self._contents:
+            return True
+        else:
+            return bool(self.directory) and os.path.exists(self.metapath(url))
+
+    def get(self, url):
+        """Return content of the URL; raises RuntimeError on failure"""
+        return self.entry(url)[0]
+
+    def entry(self, url):
+        """Return a pair of content of the URL and its metadata
+
+        The metadata has a digest of the content; it changes when the
+        content is modified on revalidation.
+        """
+        entry = self._contents.get(url)
+        if entry is None or not self.is_fresh(entry[1]):
+            with self._locks[hash(url) % self.LOCKS]:
+                entry = self._contents.get(url)  # fetched by other thread?
+                if entry is None or not self.is_fresh(entry[1]):
+                    entry = self.load(url, entry)
+                    self._contents.set(url, entry)
+
+        return entry
+
+    def open(self, url):
+        return BytesIO(self.get(url))
+
+    def clear(self):
+        self._contents.clear()
+
+    def is_fresh(self, meta):
+        return self.offline or time.time() - meta['fetched'] < self.ttl
+
+    def path(self, url):
+        if self.directory:
+            key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+            return os.path.join(self.directory, key)
+        else:
+            return ''
+
+    def metapath(self, url):
+        return self.path(url) + '.json'
+
+    def load(self, url, entry=None):
+        """Fetch the URL; returns a pair of content and its metadata
+
+        *entry* is a pair kept in memory; it is revalidated if the URL is
+        not stored in the directory.
+        """
+        content, meta = entry or (None, None)
+        if self.directory and os.path.exists(self.metapath(url)):
+            try:
+                with open(self.metapath(url)) as fd:
+                    meta = json.load(fd)
+                with open(self.path(url), 'rb') as fd:
+                    content = fd.read()
+
+                # the content might be replaced after reading metadata
+                if meta.get('digest') != digest(content):
+                    raise ValueError('digest mismatch: %s' % url)
+            except (IOError, ValueError):
+                content, meta = entry or (None, None)  # broken entry
+
+        if meta and self.is_fresh(meta):
+            return (content, meta)
+        elif self.offline:
+            raise RuntimeError('Could not retrieve (offline): %s' % url)
+
+        request = Request(url)
+        if meta and meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if meta and meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+
+        try:
+            response = urlopen(request)
+            content = response.read()
+            headers = response.info()
+            meta = dict(url=url, etag=headers.get('ETag'),
+                        last_modified=headers.get('Last-Modified'))
+        except HTTPError as exc:
+            if meta is None or exc.code != 304:  # 304: Not Modified
+                raise RuntimeError('Could not retrieve: %s' % url)
+            meta = dict(meta)
+        except IOError:
+            if meta is None:
+                raise RuntimeError('Could not retrieve: %s' % url)
+            return (content, meta)  # use stale content on network errors
+
+        meta['fetched'] = time.time()
+        meta['digest'] = digest(content)
+        if self.directory:
+            self.store(url, content, meta)
+
+        return (content, meta)
+
+    def store(self, url, content, meta):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # write entries atomically; caches might be shared by processes.
+        # metadata is written last; load() checks the digest of content
+        for path, data in ((self.path(url), content),
+                           (self.metapath(url), json.dumps(meta))):
+            fd, tmpname = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as stream:
+                if not isinstance(data, bytes):
+                    data = data.encode('utf-8')
+                stream.write(data)
+            replace(tmpname, path)
+
+
+def digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def replace(src, dst):
+    """Rename src to dst; dst is overwritten if exists"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:  # Python 2
+        try:
+            os.rename(src, dst)
+        except OSError:  # Windows does not overwrite dst
+            os.remove(dst)
+            os.rename(src, dst)
+
+
+cache = URLCache()
+
+
+def configure(directory=None, ttl=None, offline=False):
+    """Replace the cache used to retrieve remote images"""
+    global cache
+    if ttl is None:
+        ttl = DEFAULT_TTL
+
+    cache = URLCache(directory, ttl, offline)
+
+
+def get(url):
+    return cache.get(url)
+
+
+def get_entry(url):
+    return cache.entry(url)
+
+
+def open_url(url):
+    return cache.open(url)